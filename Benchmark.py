@@ -0,0 +1,383 @@
+"""End-to-end benchmarks over a generated library (see bench/library.py).
+
+   Generates a library of tiny files in every supported format, with a matching Quod Libet songs
+   file, Banshee database, playlists and a fake device directory, points the config at them, and
+   times the main operations of the scripts. Audio tools are replaced by stubs, so transcoding
+   measures the process and pipe overhead rather than the encoders. Results are written to JSON
+   and can be compared with an earlier run."""
+
+import argparse
+import collections
+import contextlib
+import datetime
+import importlib.util
+import io
+import json
+import os
+import os.path
+import platform
+import random
+import shutil
+import stat
+import statistics
+import sys
+import tempfile
+import time
+
+def import_config():
+    """Imports the config with only the values in config/defaults.py. Importing the config
+       package needs a config/user.py, which a clean checkout doesn't have; the values the
+       benchmarks depend on are all set by BenchEnv.configure."""
+    if 'config' in sys.modules:
+        return sys.modules['config']
+    spec = importlib.util.spec_from_file_location(
+        'config', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config',
+                               'defaults.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['config'] = module
+    spec.loader.exec_module(module)
+    return module
+
+# Has to come before importing anything else from this repository that imports config
+config = import_config()
+
+from bench import library as bench_library
+from core import trace
+
+# Name of the fake device under config.MediaDir
+device = 'BENCH'
+
+# Stand-in for the external audio tools: decoders write silence to stdout, and encoders read all
+# of their input and write a small file
+stub_tool = '''#!%s
+import sys
+args = sys.argv[1:]
+if '--version' in args or '-version' in args:
+    print('stub 1.0')
+    sys.exit(0)
+out = args[args.index('-o') + 1] if '-o' in args else args[-1]
+if '--stdout' in args or out == '-':
+    sys.stdout.buffer.write(bytes(2 ** 16))
+else:
+    data = sys.stdin.buffer.read() if '-' in args else b''
+    with open(out, 'wb') as fobj:
+        fobj.write(b'stub' + data[:1024])
+'''
+
+benchmarks = collections.OrderedDict()
+
+def benchmark(name):
+    """Registers a benchmark. The decorated function is given a BenchEnv, does any setup, and
+       returns a function taking no arguments that runs the timed code (and optionally returns a
+       dict of extra results). ImportErrors raised during setup mark the benchmark skipped."""
+    def decorator(func):
+        benchmarks[name] = func
+        return func
+    return decorator
+
+class BenchEnv(object):
+    """Locations of the generated library and everything made to go with it."""
+
+    def __init__(self, work_dir, num_albums, tracks_per_album, seed=0):
+        self.work_dir = work_dir
+        self.num_albums = num_albums
+        self.tracks_per_album = tracks_per_album
+        self.seed = seed
+        self.music_dir = os.path.join(work_dir, 'music')
+        self.media_dir = os.path.join(work_dir, 'media')
+        self.ql_dir = os.path.join(work_dir, 'quodlibet')
+        self.songs_loc = os.path.join(self.ql_dir, 'songs')
+        self.banshee_loc = os.path.join(work_dir, 'banshee.db')
+        self.bin_dir = os.path.join(work_dir, 'bin')
+        self.library = None
+        self.playlists = None
+
+    def generate(self):
+        if os.path.isdir(self.work_dir):
+            shutil.rmtree(self.work_dir)
+        os.makedirs(os.path.join(self.media_dir, device, 'MUSIC'))
+        albums = bench_library.make_tags(self.num_albums, self.tracks_per_album, self.seed)
+        self.library = bench_library.generate_library(self.music_dir, albums)
+        self.playlists = bench_library.make_playlists(self.library, seed=self.seed)
+        bench_library.write_ql_songs(self.songs_loc, self.library, self.seed)
+        bench_library.write_ql_playlists(os.path.join(self.ql_dir, 'playlists'), self.library,
+                                         self.playlists)
+        bench_library.write_banshee_db(self.banshee_loc, self.library, self.playlists, self.seed)
+
+        os.makedirs(self.bin_dir)
+        for tool in ('ffmpeg', 'flac', 'lame', 'oggenc', 'oggdec', 'opusenc', 'opusdec'):
+            fname = os.path.join(self.bin_dir, tool)
+            with open(fname, 'w') as fobj:
+                fobj.write(stub_tool % sys.executable)
+            os.chmod(fname, os.stat(fname).st_mode | stat.S_IXUSR)
+
+    def configure(self):
+        """Points the config at the generated files. Has to be done before importing the
+           modules that read the config when they are imported (WalkSync, db.ql, db.banshee)."""
+        config.MusicDir = self.music_dir
+        config.MediaDir = self.media_dir
+        config.DeviceOrder = [device]
+        config.BaseDevices = [device]
+        config.PlaylistsToSync = dict()
+        config.QLSongsLoc = self.songs_loc
+        config.BansheeDbLoc = self.banshee_loc
+        config.TagCacheLoc = None
+        config.TranscodeCacheDir = None
+        os.environ['PATH'] = self.bin_dir + os.pathsep + os.environ.get('PATH', '')
+
+    @property
+    def locations(self):
+        return [loc for loc, tags in self.library]
+
+    def scanned_tracks(self):
+        """Returns a Metadata object for each file in the library, read from the files (or the
+           generated tags, for files that can't hold tags), with a location, length in
+           milliseconds and device."""
+        from core.metadata import Metadata
+        from mfile import scan_music_files
+
+        tracks = list()
+        for record, (loc, tags) in zip(scan_music_files(self.locations), self.library):
+            if os.path.splitext(loc)[1] in bench_library.untagged_exts:
+                md = Metadata.from_dict(tags)
+            else:
+                md = record.to_metadata()
+            md.location = loc
+            md.length = (record.length or 0) * 1000
+            md.device = device
+            tracks.append(md)
+        return tracks
+
+@benchmark('tag_scan')
+def bench_tag_scan(env):
+    from mfile import scan_music_files
+    locs = env.locations
+
+    def run():
+        records = list(scan_music_files(locs))
+        return {'files': len(records), 'errors': len([r for r in records if r.error])}
+    return run
+
+@benchmark('tag_scan_serial')
+def bench_tag_scan_serial(env):
+    from mfile import scan_music_files
+    locs = env.locations
+
+    def run():
+        records = list(scan_music_files(locs, workers=1))
+        return {'files': len(records)}
+    return run
+
+@benchmark('match_metadata_to_tracks')
+def bench_match(env):
+    from core.metadata import Metadata
+    from match import match_metadata_to_tracks
+
+    tracks = env.scanned_tracks()
+    metadatas = [Metadata.from_dict(tags) for loc, tags in env.library]
+    random.Random(env.seed).shuffle(metadatas)
+
+    def run():
+        matched, unmatched_1, unmatched_2 = match_metadata_to_tracks(tracks, metadatas)
+        return {'matched': len(matched), 'unmatched': len(unmatched_1) + len(unmatched_2)}
+    return run
+
+@benchmark('walksync_get_changes')
+def bench_walksync(env):
+    import WalkSync
+
+    tracks = env.scanned_tracks()
+    # Put half of the tracks on the device already, a few of them changed since, along with
+    # some files that are no longer in the library
+    dests = WalkSync.get_changes(list(tracks), None, True)
+    rng = random.Random(env.seed)
+    for loc, dest, action, reason in dests:
+        if loc is not None and rng.random() < 0.5:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copy2(loc, dest)
+            if rng.random() < 0.1:
+                with open(dest, 'ab') as fobj:
+                    fobj.write(b'\x00' * 16)
+                os.utime(dest, (0, 0))
+    stale_dir = os.path.join(env.media_dir, device, 'MUSIC', 'Stale Artist', 'Stale Album')
+    os.makedirs(stale_dir, exist_ok=True)
+    for i in range(20):
+        with open(os.path.join(stale_dir, '%02d Stale.mp3' % i), 'wb') as fobj:
+            fobj.write(b'\x00' * 64)
+
+    def run():
+        changes = WalkSync.get_changes(list(tracks), None, True)
+        counts = collections.Counter([action.name.lower() for loc, dest, action, reason in
+                                      changes])
+        return dict(counts)
+    return run
+
+@benchmark('playlist_generation')
+def bench_playlists(env):
+    import WalkSync
+
+    tracks = env.scanned_tracks()
+    playlists = dict([(name, [tracks[i] for i in indices])
+                      for name, indices in env.playlists.items()])
+    generators = [WalkSync.genM3UPlaylist, WalkSync.genM3U8Playlist, WalkSync.genQLPlaylist,
+                  WalkSync.genXSPFPlaylist]
+    base_dir = os.path.join(env.media_dir, device, 'MUSIC')
+
+    def run():
+        size = 0
+        for name, p_tracks in sorted(playlists.items()):
+            for gen in generators:
+                size += len(gen(name, p_tracks, base_dir))
+        return {'playlists': len(playlists) * len(generators), 'chars': size}
+    return run
+
+@benchmark('trackplays_update_db')
+def bench_trackplays(env):
+    import TrackPlays
+
+    TrackPlays.db_name = os.path.join(env.work_dir, 'plays.db')
+    TrackPlays.delta_db_name = os.path.join(env.work_dir, 'delta_plays.db')
+
+    def run():
+        # Start from empty databases each time, so every track is inserted
+        for fname in (TrackPlays.db_name, TrackPlays.delta_db_name):
+            if os.path.exists(fname):
+                os.remove(fname)
+        with contextlib.redirect_stdout(io.StringIO()):
+            TrackPlays.update_db(False, False)
+    return run
+
+@benchmark('transcode')
+def bench_transcode(env):
+    from Transcode import convert
+
+    # A few files of each format, converted to the default format
+    by_ext = collections.defaultdict(list)
+    for loc, tags in env.library:
+        by_ext[os.path.splitext(loc)[1]].append((loc, tags))
+    jobs = list()
+    out_dir = os.path.join(env.work_dir, 'transcoded')
+    os.makedirs(out_dir, exist_ok=True)
+    ext = config.DefaultEncodeExt
+    for in_ext, files in sorted(by_ext.items()):
+        for i, (loc, tags) in enumerate(files[:5]):
+            dest = os.path.join(out_dir, '%s-%d%s' % (in_ext[1:], i, ext))
+            jobs.append((loc, dest, dict(tags)))
+
+    def run():
+        for loc, dest, metadata in jobs:
+            convert(loc, dest, metadata, ext, config.DefaultBitrate, False)
+        return {'files': len(jobs)}
+    return run
+
+def run_benchmarks(env, names, repeat):
+    results = collections.OrderedDict()
+    for name in names:
+        try:
+            with trace.span('setup %s' % name):
+                run = benchmarks[name](env)
+        except ImportError as ex:
+            results[name] = {'status': 'skipped', 'reason': '%s: %s' % (type(ex).__name__, ex)}
+            print('%-28s skipped (%s)' % (name, ex))
+            continue
+
+        times = list()
+        extra = None
+        try:
+            for i in range(repeat):
+                with trace.span(name):
+                    start = time.perf_counter()
+                    extra = run()
+                    times.append(time.perf_counter() - start)
+        except Exception as ex:
+            results[name] = {'status': 'error', 'reason': '%s: %s' % (type(ex).__name__, ex)}
+            print('%-28s failed (%s: %s)' % (name, type(ex).__name__, ex))
+            continue
+
+        result = {'status': 'ok', 'times': times, 'best': min(times),
+                  'median': statistics.median(times)}
+        if extra:
+            result['results'] = extra
+        results[name] = result
+        print('%-28s best %9.1fms  median %9.1fms  %s' %
+              (name, result['best'] * 1e3, result['median'] * 1e3,
+               ' '.join(['%s=%s' % item for item in sorted((extra or {}).items())])))
+    return results
+
+def compare(old, new):
+    """Prints the best times of two runs' results side by side."""
+    old_params, new_params = old.get('parameters', {}), new.get('parameters', {})
+    if old_params != new_params:
+        print('Note: parameters differ (%s vs %s)' % (old_params, new_params))
+    print('%-28s %12s %12s %8s' % ('benchmark', 'before ms', 'after ms', 'change'))
+    for name in new['benchmarks']:
+        before = old['benchmarks'].get(name, {})
+        after = new['benchmarks'][name]
+        if before.get('status') != 'ok' or after.get('status') != 'ok':
+            print('%-28s %12s %12s' % (name, before.get('status', 'missing'),
+                                       after['status']))
+            continue
+        print('%-28s %12.1f %12.1f %7.2fx' % (name, before['best'] * 1e3, after['best'] * 1e3,
+                                              before['best'] / after['best']))
+
+def main():
+    parser = argparse.ArgumentParser(description='Run benchmarks over a generated library')
+    parser.add_argument('--albums', type=int, default=50,
+                        help='Number of albums to generate (default %(default)s)')
+    parser.add_argument('--tracks', type=int, default=10,
+                        help='Number of tracks per album disc (default %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of times to run each benchmark (default %(default)s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dir', help='Directory to generate the library in (deleted and '
+                                      'recreated; default: a temporary directory)')
+    parser.add_argument('--keep', action='store_true',
+                        help="Don't delete the generated library afterwards")
+    parser.add_argument('--only', nargs='+', choices=list(benchmarks.keys()),
+                        help='Benchmarks to run (default: all)')
+    parser.add_argument('--out', '-o', help='File to write the results to, as JSON')
+    parser.add_argument('--compare', metavar='OLD.json',
+                        help='Results of an earlier run to compare with')
+    trace.add_trace_argument(parser)
+    args = parser.parse_args()
+    trace.trace_from_args(args)
+
+    work_dir = args.dir
+    if work_dir is None:
+        work_dir = tempfile.mkdtemp(prefix='bench-')
+    work_dir = os.path.abspath(work_dir)
+
+    env = BenchEnv(work_dir, args.albums, args.tracks, args.seed)
+    try:
+        start = time.perf_counter()
+        with trace.span('generate library'):
+            env.generate()
+        print('Generated %d tracks in %s in %.1fs' % (len(env.library), work_dir,
+                                                      time.perf_counter() - start))
+        env.configure()
+
+        names = args.only or list(benchmarks.keys())
+        results = {'timestamp': datetime.datetime.now().isoformat(),
+                   'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'parameters': {'albums': args.albums, 'tracks': args.tracks,
+                                  'seed': args.seed, 'repeat': args.repeat,
+                                  'num_tracks': len(env.library)},
+                   'benchmarks': run_benchmarks(env, names, args.repeat)}
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.out:
+        with open(args.out, 'w') as fobj:
+            json.dump(results, fobj, indent=2)
+        print('Results written to %s' % args.out)
+
+    if args.compare:
+        with open(args.compare, 'r') as fobj:
+            old = json.load(fobj)
+        print()
+        compare(old, results)
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@ from core.util import convert_str_value
 
 from parse.web import download_album_art, get_art_url
 from Metadata import parse_metadata_string
+from core import trace
 
 def main():
     progDesc = """Download album artwork."""
@@ -17,7 +18,9 @@ def main():
     parser.add_argument('-d', '--domain', help="Manually set the domain for web parsing")
     parser.add_argument("sources", nargs='+',
         help="The source(s) to get metadata from (db, files, or a location of a track list).")
+    trace.add_trace_argument(parser)
     args = parser.parse_args()
+    trace.trace_from_args(args)
 
     extra_args = dict([(k, convert_str_value(v)) for k, v in args.extra])
 
@@ -4,6 +4,7 @@ import argparse
 
 from mfile import mapping as mfile_mapping
 import config
+from core import trace
 
 mfile_exts = set(mfile_mapping.keys())
 art_exts = set(config.ArtExts)
@@ -19,7 +20,9 @@ def main():
 
     parser.add_argument('directory', help='The directory to work on.')
 
+    trace.add_trace_argument(parser)
     args = parser.parse_args()
+    trace.trace_from_args(args)
 
     run(args.directory)
 
@@ -9,6 +9,7 @@ import re
 import collections
 
 from mutagen.oggvorbis import OggVorbis
+from core import trace
 
 tc_re = re.compile(r'(\d+)/(\d+)')
 
@@ -64,7 +65,9 @@ def main():
                         help="Only preview changes, do not actually make them.")
     parser.add_argument('directory', help='The directory to work on.')
 
+    trace.add_trace_argument(parser)
     args = parser.parse_args()
+    trace.trace_from_args(args)
 
     run(args.directory, args.test)
 
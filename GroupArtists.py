@@ -5,6 +5,7 @@ import string
 
 from core.util import get_sort_char
 import config
+from core import trace
 
 group_names = set(string.ascii_uppercase + '0')
 group_names.add('Singletons')
@@ -73,7 +74,9 @@ def main():
                         help='Whether to group or ungroup artists on the device.')
     parser.add_argument('directory', help='The directory to work on.')
 
+    trace.add_trace_argument(parser)
     args = parser.parse_args()
+    trace.trace_from_args(args)
 
     run(args.action, args.directory, args.test)
 
@@ -9,13 +9,14 @@ from core.track import Track
 
 from db.db import MusicDb
 
-from mfile import mapping
+from mfile import mapping, warm_tag_cache
 from mfile.mfile import MusicFile
 
 from parse.file import read_tracklist, tracklist_exts, write_tracklist
 from parse.web import url_re, parse_tracklist_from_url, download_album_art, get_art_url
 
 from match import match_metadata_to_tracks
+from core import trace
 
 def sync_tracks(source_tracks, dest_tracks, copy_none, reloc, only_db_fields, test):
     if dest_tracks or not reloc:
@@ -25,12 +26,16 @@ def sync_tracks(source_tracks, dest_tracks, copy_none, reloc, only_db_fields, te
         matched = list(zip(source_tracks[:], source_tracks[:]))
         unmatched_sources, unmatched_dests = [], []
 
-    mfiles_saved, dbs_saved = 0, 0
-    for source_track, dest_track in matched:
-        mfile_saved, db_saved = sync_track(source_track, dest_track, copy_none,
-                                           reloc, only_db_fields, test)
-        mfiles_saved += mfile_saved
-        dbs_saved += db_saved
+    mfiles_saved, mfiles_rewritten, dbs_saved = 0, 0, 0
+    # The database changes are written and committed together once all tracks are synced
+    with DefaultDb().batch():
+        for source_track, dest_track in matched:
+            mfile_saved, db_saved = sync_track(source_track, dest_track, copy_none,
+                                               reloc, only_db_fields, test)
+            mfiles_saved += mfile_saved
+            if mfile_saved and getattr(dest_track.mfile, 'rewritten', False):
+                mfiles_rewritten += 1
+            dbs_saved += db_saved
 
     if unmatched_sources:
         print()
@@ -39,9 +44,9 @@ def sync_tracks(source_tracks, dest_tracks, copy_none, reloc, only_db_fields, te
             print()
 
     print('%d/%d matched' % (len(matched), len(source_tracks)))
-
-    if not test and dbs_saved:
-        DefaultDb().commit()
+    if mfiles_saved:
+        print('%d files saved (%d in place, %d rewritten)' % (mfiles_saved,
+                mfiles_saved - mfiles_rewritten, mfiles_rewritten))
 
 def sync_track(source_track, dest_track, copy_none, reloc, only_db_fields, test):
     track_changes = collections.defaultdict(dict)
@@ -98,7 +103,7 @@ def copy_metadata(source_tracks, dest_strs, copy_none, reloc, only_db_fields, te
     if not dest_strs and reloc:
         sync_tracks(source_tracks, [], copy_none, reloc, only_db_fields, test)
     if not dest_strs and apply_:
-        dest_tracks = [Track.from_file(t.location) for t in source_tracks]
+        dest_tracks = Track.from_files([t.location for t in source_tracks])
         sync_tracks(source_tracks, dest_tracks, copy_none, reloc, only_db_fields, test)
     else:
         for dest_str in dest_strs:
@@ -147,7 +152,9 @@ def parse_metadata_string(s, domain=None, extra_args=None):
     else: # Could be a glob
         fnames = get_fnames(s)
 
-    tracks = [Track.from_file(fname, default_metadata=default_metadata) for fname in fnames]
+    # Read the files' tags concurrently up front; the tracks are then loaded from the cache
+    warm_tag_cache(fnames)
+    tracks = Track.from_files(fnames, default_metadata=default_metadata)
     for t in tracks:
         for arg, v in extra_args.items():
             setattr(t, arg, v)
@@ -175,7 +182,9 @@ def main():
         help="The source to get metadata from (db, files, or a location of a track list).")
     parser.add_argument("dests", nargs='*', help="The files being edited, if any.")
 
+    trace.add_trace_argument(parser)
     args = parser.parse_args()
+    trace.trace_from_args(args)
 
     extra_args = dict([(k, convert_str_value(v)) for k, v in args.extra])
     source_tracks, source_type = parse_metadata_string(args.source, args.domain, extra_args)
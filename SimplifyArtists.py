@@ -2,32 +2,37 @@ import argparse
 import os
 import os.path
 
-from mfile import mapping as mfile_mapping, open_music_file
+from mfile import mapping as mfile_mapping, open_music_file, scan_music_files
 import config
+from core import trace
 
 def run(directory, test):
     if not os.path.isdir(directory):
         print('%s does not exist.' % directory)
         raise SystemExit
 
+    paths = list()
     for dirpath, dirnames, filenames in os.walk(directory):
         for fname in filenames:
             ext = os.path.splitext(fname)[1].lower()
             if ext in mfile_mapping:
-                path = os.path.join(dirpath, fname)
-                try:
-                    metadata = open_music_file(path)
-                except Exception as ex:
-                    print(path)
-                    raise
-
-                artist = metadata.artist
-                album_artist = metadata.album_artist
-                if album_artist is not None and album_artist != artist:
-                    print('%s\t%s\t%s' % (path, artist, album_artist))
-                    if not test:
-                        metadata.artist = album_artist
-                        metadata.save()
+                paths.append(os.path.join(dirpath, fname))
+
+    for record in scan_music_files(paths):
+        path = record.path
+        if record.error is not None:
+            print(path)
+            raise record.error
+
+        metadata = record.to_metadata()
+        artist = metadata.artist
+        album_artist = metadata.album_artist
+        if album_artist is not None and album_artist != artist:
+            print('%s\t%s\t%s' % (path, artist, album_artist))
+            if not test:
+                mfile = open_music_file(path)
+                mfile.artist = album_artist
+                mfile.save()
 
 
 def main():
@@ -37,7 +42,9 @@ def main():
                         help="Only preview changes, do not actually make them.")
     parser.add_argument('directory', help='The directory to work on.')
 
+    trace.add_trace_argument(parser)
     args = parser.parse_args()
+    trace.trace_from_args(args)
 
     run(args.directory, args.test)
 
@@ -7,6 +7,7 @@ import argparse
 import glob
 import re
 import subprocess
+from core import trace
 
 try:
 
@@ -89,7 +90,9 @@ def main():
     parser.add_argument("-t", "--test", action="store_true", help="Only display changes, don't sync any files")
     parser.add_argument('-p', '--playlists', action='store_true')
 
+    trace.add_trace_argument(parser)
     args = parser.parse_args()
+    trace.trace_from_args(args)
 
 
     if not os.path.isdir(artists_dir):
@@ -5,15 +5,17 @@ import argparse
 
 from core.util import compare_filesets
 import config
+from core.metadata import calculate_fnames
 from urllib.parse import quote
 from core.track import Track
 
 from Transcode import convert
+from core import trace
 
 playlists_dir = os.path.join(os.path.dirname(config.QLSongsLoc), 'playlists')
 
 def quick_sync(p_file, dest_dir, flat, delete, test, transcode=None):
-    from mfile import open_music_file
+    from mfile import scan_music_files
 
     # Get list of files currently in the destination directory
     cur_files = list()
@@ -24,10 +26,14 @@ def quick_sync(p_file, dest_dir, flat, delete, test, transcode=None):
     # Get a mapping from track destinations to their current locations
     dests_to_locs = dict()
     ext = None if transcode is None else ('.' + transcode)
-    for loc in locs:
-        mfile = open_music_file(loc)
-        dest = mfile.calculate_fname(dest_dir, nested=not flat, ext=ext)
-        dests_to_locs[dest] = loc
+    records = list(scan_music_files(locs))
+    for record in records:
+        if record.error is not None:
+            raise record.error
+    dests = calculate_fnames([record.to_metadata() for record in records], dest_dir,
+                             nested=not flat, ext=ext)
+    for record, dest in zip(records, dests):
+        dests_to_locs[dest] = record.path
 
     _sync(dests_to_locs, cur_files, delete, test, transcode)
 
@@ -55,7 +61,8 @@ def _sync(dests_to_locs, cur_files, delete, test, transcode=None):
                     shutil.copy(loc, dest)
                 else:
                     metadata = Track.from_file(loc, default_metadata='db')
-                    convert(loc, dest, metadata, '.' + transcode, metadata.bitrate // 1000)
+                    convert(loc, dest, metadata.to_dict(), '.' + transcode,
+                            metadata.bitrate // 1000, test)
             print('\t', dest)
 
     if delete:
@@ -92,9 +99,11 @@ def main():
     parser.add_argument("-t", "--test", action="store_true", help="Only display changes; do not "
                             "sync any files.")
     parser.add_argument("--transcode", help="Transcode to this format",
-                        choices=['mp3', 'ogg'], default=None)
+                        choices=['mp3', 'ogg', 'opus', 'flac', 'm4a'], default=None)
 
+    trace.add_trace_argument(parser)
     args = parser.parse_args()
+    trace.trace_from_args(args)
 
     p_file = os.path.join(playlists_dir, quote(args.playlist))
     print(p_file)
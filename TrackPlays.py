@@ -4,6 +4,7 @@ import argparse
 
 from core.db_glue import new
 from db.ql import QLDb
+from core import trace
 
 db_name = 'plays.db'
 delta_db_name = 'delta_plays.db'
@@ -28,7 +29,7 @@ def _make_where_str(track, keys=db_keys):
     return ' AND '.join(l)
 
 def get_db(fname):
-    db = new(fname)
+    db = new(fname, wal=True)
     db.sql("""CREATE TABLE IF NOT EXISTS plays
 (title text NOT NULL,
 artist text NOT NULL,
@@ -43,7 +44,7 @@ play_count integer DEFAULT 0)""")
     return db
 
 def get_delta_db(fname):
-    db = new(fname)
+    db = new(fname, wal=True)
     db.sql("""CREATE TABLE IF NOT EXISTS delta_plays
 (title text NOT NULL,
 artist text NOT NULL,
@@ -96,7 +97,7 @@ def update_db(dryrun, verbose):
        last update) to the delta_plays db/table."""
     db = get_db(db_name)
 
-    tracks = QLDb.load_all()
+    tracks = QLDb.load_records()
 
     new_delta = not os.path.exists(delta_db_name)
     delta_db = get_delta_db(delta_db_name)
@@ -152,15 +153,17 @@ def update_db(dryrun, verbose):
         if delta is not None and delta > 0:
             save_delta(track, delta, delta_db, verbose)
 
-    unmatched_rows =  db.sql("SELECT rowid, title, artist, album, dn, tn FROM plays WHERE rowid NOT IN (%s)" %
-                                ','.join(map(str, rowids_matched)))
-    if unmatched_rows:
-        for row in unmatched_rows:
-            print('Deleting (%(title)s, %(artist)s, %(album)s, %(dn)s, %(tn)s)' % row)
-            sql = 'DELETE FROM plays WHERE rowid = ?'
-            if verbose:
-                print(db.preview_sql(sql, row['rowid']))
-            db.sql(sql, row['rowid'])
+    unmatched_rows = db.iter_sql("SELECT rowid, title, artist, album, dn, tn FROM plays WHERE rowid NOT IN (%s)" %
+                                 ','.join(map(str, rowids_matched)))
+    # Delete the rows once they have all been read
+    rowids_to_delete = list()
+    sql = 'DELETE FROM plays WHERE rowid = ?'
+    for row in unmatched_rows:
+        print('Deleting (%(title)s, %(artist)s, %(album)s, %(dn)s, %(tn)s)' % row)
+        if verbose:
+            print(db.preview_sql(sql, row['rowid']))
+        rowids_to_delete.append((row['rowid'],))
+    db.sql_many(sql, rowids_to_delete)
 
     if not dryrun:
         db.commit()
@@ -237,8 +240,7 @@ def update_play_counts(dryrun, verbose):
     if not dryrun:
         QLDb.commit()
 
-    extra_rows = delta_db.sql('SELECT * FROM delta_plays')
-    for row in extra_rows:
+    for row in delta_db.iter_sql('SELECT * FROM delta_plays'):
         print('WARNING:\tUnmatched row - %(title)s, %(artist)s, %(album)s, %(dn)s, %(tn)s' % row)
     if not dryrun:
         delta_db.commit()
@@ -257,7 +259,9 @@ def main():
     parser.add_argument('-v', '--verbose', action='store_true', help='Print SQL statements to execute')
     parser.add_argument('action', choices=['up', 'down'])
 
+    trace.add_trace_argument(parser)
     args = parser.parse_args()
+    trace.trace_from_args(args)
 
     if args.action == 'up':
         update_db(args.test, args.verbose)
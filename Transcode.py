@@ -1,7 +1,9 @@
 import os
 import os.path
 import argparse
+import logging
 import re
+import subprocess
 from concurrent.futures import ProcessPoolExecutor
 import operator
 from itertools import repeat
@@ -17,33 +19,91 @@ from db.db import MusicDb
 from match import match_metadata_to_files
 from mfile import open_music_file
 from mfile.mfile import MusicFile
+from mfile.transcode_cache import transcode_cache
 from parse import get_track_list
 from core.track import Track
+from core import trace
 
 http_re = re.compile(r'^https?://', flags=re.IGNORECASE)
 
+# Size in bytes of the chunks of raw audio passed from a decoder to an encoder
+pipe_chunk_size = 2 ** 16
+
+def _check_returncode(process):
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, process.args)
+
+def pipe(decoder, encoder, chunk_size=pipe_chunk_size):
+    """Streams raw audio from the decoder's stdout to the encoder's stdin a chunk at a time, so
+       memory use stays constant and encoding starts right away. Waits for both processes to
+       finish; raises CalledProcessError if either of them failed."""
+    try:
+        while True:
+            chunk = decoder.stdout.read(chunk_size)
+            if not chunk:
+                break
+            encoder.stdin.write(chunk)
+    except BrokenPipeError:
+        # The encoder exited early; its return code says why
+        pass
+    finally:
+        # Closing our end of the decoder's output stops it if it is still running
+        decoder.stdout.close()
+        try:
+            encoder.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    encoder.wait()
+    decoder.wait()
+    _check_returncode(encoder)
+    _check_returncode(decoder)
+
+@trace.traced('convert')
 def convert(infile, outfile, metadata, out_ext, bitrate, test):
     if not test:
         # Sanity check for bitrate
         if bitrate > 2000:
             bitrate //= 1000
         in_md = open_music_file(infile)
-        decoder = in_md.create_decoder()
+
+        out_class = mfile_mapping[out_ext]
 
         if os.path.exists(outfile):
             os.remove(outfile)
 
+        # Reuse an earlier encoding of the same audio with the same settings and tags
+        cache = transcode_cache()
+        key = None
+        if cache is not None:
+            try:
+                key = cache.key(in_md, out_class, bitrate, metadata)
+            except (OSError, ValueError) as ex:
+                # The audio couldn't be hashed, so encode it without the cache
+                logging.debug('Could not hash the audio of %s: %s', infile, ex)
+            if key is not None and cache.fetch(key, outfile):
+                trace.count('transcode cache hits')
+                return outfile
+
+        decoder = in_md.create_decoder()
         if decoder is None:
-            mfile_mapping[out_ext].create_encoder(outfile, metadata, bitrate, infile=infile)
+            encoder = out_class.create_encoder(outfile, metadata, bitrate, infile=infile)
+            encoder.wait()
+            _check_returncode(encoder)
         else:
-            encoder = mfile_mapping[out_ext].create_encoder(outfile, metadata, bitrate)
+            encoder = out_class.create_encoder(outfile, metadata, bitrate)
+            pipe(decoder, encoder)
 
-            decodedData, errs = decoder.communicate()
-            encoder.communicate(decodedData)
+        if key is not None:
+            cache.store(key, outfile)
+        if trace.enabled():
+            trace.count('transcoded bytes', os.path.getsize(outfile))
 
     return outfile
 
-def transcode(input_files, oom, bitrate, test):
+def transcode(input_files, oom, bitrate, test, ext=None):
+    if ext is None:
+        ext = config.DefaultEncodeExt
 
     input_files = get_fnames(input_files)
 
@@ -51,7 +111,7 @@ def transcode(input_files, oom, bitrate, test):
     if os.path.isfile(oom) or http_re.match(oom):
         output_tracks = [Track.from_metadata(m, match_to_existing=False) for m in get_track_list(oom, {})]
     else:
-        output_tracks = [Track.from_file(fname, default_metadata='db') for fname in get_fnames(oom)]
+        output_tracks = Track.from_files(get_fnames(oom), default_metadata='db')
 
     matched, unmatched_inputs, unmatched_outputs = match_metadata_to_files(input_files, output_tracks)
 
@@ -61,7 +121,7 @@ def transcode(input_files, oom, bitrate, test):
     dests = list()
     for o in matched_outputs:
         if getattr(o, 'location', None) is None or not o.location.startswith(config.MusicDir):
-            dests.append(o.calculate_fname(ext=config.DefaultEncodeExt))
+            dests.append(o.calculate_fname(ext=ext))
         else:
             dests.append(o.location)
     output_dir = os.path.dirname(dests[0])
@@ -69,13 +129,17 @@ def transcode(input_files, oom, bitrate, test):
         os.makedirs(output_dir)
     exts = [os.path.splitext(dest)[1] for dest in dests]
 
-    with ProcessPoolExecutor() as executor:
+    # Database updates are written and committed together when the batch ends
+    with ProcessPoolExecutor() as executor, config.DefaultDb().batch():
         for (input_track, output_track), fname, dest, _ in \
-            zip(matched, sources, dests, executor.map(convert, sources, dests, metadatas,
-                                                      exts, repeat(bitrate), repeat(test))):
+            zip(matched, sources, dests, map(trace.merge, executor.map(
+                trace.remote(convert), sources, dests, metadatas, exts, repeat(bitrate),
+                repeat(test)))):
 
             if not test:
                 encoded = open_music_file(dest)
+                # The output track may wrap the file that was just overwritten
+                output_track.refresh()
             else:
                 encoded = Metadata.from_dict({'bitrate': bitrate * 1000,
                                               'fsize': int(input_track.length * bitrate / 8)})
@@ -110,24 +174,26 @@ def transcode(input_files, oom, bitrate, test):
         print('Output %s NOT MATCHED' % track.title)
         print()
 
-    if not test:
-        config.DefaultDb().commit()
-
     print('%d out of %d/%d matched' % (len(matched), len(input_files), len(output_tracks)))
 
 def main():
     parser = argparse.ArgumentParser(description="Transcode a set of music files.")
     parser.add_argument("-b", "--bitrate", type=int, default=config.DefaultCDBitrate,
                         help="The bitrate to encode to")
+    parser.add_argument('-e', "--ext", choices=['.mp3', '.ogg', '.opus', '.flac', '.m4a'],
+                        default=config.DefaultEncodeExt,
+                        help="The file type to encode new files to")
     parser.add_argument('-t', "--test", action="store_true",
                         help="Only preview changes, do not actually make them.")
     parser.add_argument("input", help="Specify the files/directory of files to encode from.")
     parser.add_argument('output_or_metadata', help='Either the files/directory of files to overwrite, '
                             'or the location of metadata describing the tracks.')
 
+    trace.add_trace_argument(parser)
     args = parser.parse_args()
+    trace.trace_from_args(args)
 
-    transcode(args.input, args.output_or_metadata, args.bitrate, args.test)
+    transcode(args.input, args.output_or_metadata, args.bitrate, args.test, args.ext)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
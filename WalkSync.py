@@ -11,15 +11,18 @@ import glob
 import collections
 import itertools
 from queue import Queue, Empty
+from mutagen import MutagenError
 import cProfile
 import pstats
 import time
 import io
 import collections
 
-from mfile import open_music_file, mapping as mfile_mapping
+from mfile import open_music_file, mapping as mfile_mapping, tag_cache
 
 import config
+from core.metadata import calculate_fnames
+from core import trace
 from core.util import compare_filesets, excape_xml_chars, pathname2xml, sort_key, \
         escape_fname
 
@@ -30,6 +33,7 @@ class Action(enum.Enum):
     UPDATE = 1
     DELETE = 2
     SKIP = 3
+    RETAG = 4
 
 lame_input_formats = ('.mp3', '.wav')
 
@@ -71,9 +75,8 @@ def get_changes(tracks, changes, synchronous, limit=None):
         put = changes.put
 
     tracks.sort(key=sort_key())
-    dests = [t.calculate_fname(os.path.join(BASE_DIR, t.device, 'MUSIC'),
-                                group_artists=config.GroupArtistsMedia)
-                    for t in tracks]
+    dests = calculate_fnames(tracks, lambda t: os.path.join(BASE_DIR, t.device, 'MUSIC'),
+                             group_artists=config.GroupArtistsMedia)
 
     # Check for cover art
     cover_art_dests = collections.defaultdict(lambda: collections.defaultdict(int))
@@ -165,7 +168,20 @@ def get_changes(tracks, changes, synchronous, limit=None):
                     if loc_size != dest_size:
                         action, reason = Action.UPDATE, \
                             f'Sizes do not match: {loc_size/(2 ** 20):.2}MB != {dest_size/(2 ** 20):.2}MB'
-            if action is Action.UPDATE:
+            if action is Action.UPDATE and not is_art and config.SyncRetagOnly and \
+                ext.lower() in mfile_mapping:
+                try:
+                    # Hashing only needs the file type and location, not the tags
+                    if open_music_file(loc, stat_only=True).content_hash() == \
+                       open_music_file(dest, stat_only=True).content_hash():
+                        if copy_tags(loc, dest) is not None:
+                            action, reason = Action.RETAG, "Only tags have changed"
+                        else:
+                            logging.debug('Tags of %s that only a full copy can sync have '
+                                          'changed', loc)
+                except (OSError, ValueError, MutagenError) as ex:
+                    logging.debug('Could not compare audio of %s and %s: %s', loc, dest, ex)
+            if action is Action.UPDATE or action is Action.RETAG:
                 updated += 1
         else: # File does not exist on player
             action, reason = Action.SYNC, "Does not exist on player"
@@ -187,6 +203,50 @@ def get_changes(tracks, changes, synchronous, limit=None):
 # SYNCER THREAD
 #------------------------------------------------------------------------------
 
+def simplify_artist(dest):
+    # Change the artist of a synced track to match its album artist
+    ext = os.path.splitext(dest)[1].lower()
+    if ext in mfile_mapping:
+        metadata = open_music_file(dest)
+        artist = metadata.artist
+        album_artist = metadata.album_artist
+        if album_artist is not None and album_artist != artist:
+            metadata.artist = album_artist
+            metadata.save()
+
+def copy_tags(loc, dest):
+    # Opens a source file and a synced copy of it and sets the tags of the copy to those of
+    # the source, without saving it. Returns the copy if that made all of its tags the same
+    # as the source's, or None if some of the tags that differ aren't metadata keys (e.g.
+    # embedded art or ReplayGain), in which case the whole file has to be copied
+    file_class = mfile_mapping[os.path.splitext(loc)[1].lower()]
+    source, synced = file_class(loc), file_class(dest)
+    for k, v in sorted(synced.update_changes(source).items(), reverse=True):
+        if getattr(synced, k) == v:
+            # Already changed along with another key (e.g. album_artist defaulting to artist)
+            continue
+        if v is None:
+            try:
+                delattr(synced, k)
+            except KeyError:
+                pass
+        else:
+            setattr(synced, k, v)
+    if synced.raw_tags() != source.raw_tags():
+        return None
+    return synced
+
+def retag(loc, dest):
+    # Copy the tags of a source file to a synced copy with the same audio, then copy the
+    # source's modification time so the copy is considered up to date. Returns False (and
+    # leaves the copy alone) if the tags can't all be copied
+    synced = copy_tags(loc, dest)
+    if synced is None:
+        return False
+    synced.save()
+    shutil.copystat(loc, dest)
+    return True
+
 def track_sync(changes, dryrun, size, shell_cmds, synchronous=False):
     #Sync the tracks
     synced = 0
@@ -277,21 +337,36 @@ def track_sync(changes, dryrun, size, shell_cmds, synchronous=False):
                 else:
                     logging.info("Updating \t%s\t(%s)" % (dest, reason))
             if not dryrun:     
-                shutil.copy2(loc, dest)
+                with trace.span('copy') as s:
+                    shutil.copy2(loc, dest)
+                    if trace.enabled():
+                        # dest's size may have been cached before it was overwritten
+                        s.add_bytes(getsize(loc))
                 if config.SimplifyArtists:
-                    ext = os.path.splitext(dest)[1].lower()
-                    if ext in mfile_mapping:
-                        metadata = open_music_file(dest)
-                        artist = metadata.artist
-                        album_artist = metadata.album_artist
-                        if album_artist is not None and album_artist != artist:
-                            metadata.artist = album_artist
-                            metadata.save()
+                    simplify_artist(dest)
 
             if action == Action.SYNC:
                 synced += 1
             else:
                 updated += 1
+
+        elif action == Action.RETAG:
+            if size:
+                size_deltas[dest_device] += getsize(loc) - getsize(dest)
+            if shell_cmds:
+                print('cp %s %s' % (escape_fname(loc), escape_fname(dest)))
+            else:
+                logging.info("Retagging \t%s\t(%s)" % (dest, reason))
+            if not dryrun:
+                with trace.span('retag'):
+                    retagged = retag(loc, dest)
+                if not retagged:
+                    # The source has changed since it was checked
+                    logging.info("Updating \t%s\t(%s)" % (dest, "Tags can't be copied"))
+                    shutil.copy2(loc, dest)
+                if config.SimplifyArtists:
+                    simplify_artist(dest)
+            updated += 1
         else:
             if showSkipped and not shell_cmds:
                 logging.info("Skipping\t%s\t(%s)" % (dest, reason))
@@ -377,49 +452,27 @@ def add_extra_track_data(playlists):
 
 def genM3UPlaylist(p_name, p_tracks, base_dir):
     lines = ["#EXTM3U"]
-    call_base_dir = callable(base_dir)
-    for track in p_tracks:
-        if call_base_dir:
-            bd = base_dir(track)
-        else:
-            bd = base_dir
+    fnames = calculate_fnames(p_tracks, base_dir, group_artists=config.GroupArtistsMedia)
+    for track, fname in zip(p_tracks, fnames):
         lines.append("#EXTINF:%d,%s - %s" % (track.length/1000, track.artist, track.title))
-        lines.append(track.calculate_fname(bd, group_artists=config.GroupArtistsMedia))
+        lines.append(fname)
     return "%s\n" % '\n'.join(lines)
 
 def genM3U8Playlist(p_name, p_tracks, base_dir):
     lines = ["#EXTM3U"]
-    call_base_dir = callable(base_dir)
-    for track in p_tracks:
-        if call_base_dir:
-            bd = base_dir(track)
-        else:
-            bd = base_dir
-        lines.append(track.calculate_fname(bd, group_artists=config.GroupArtistsMedia)
-                    .replace('/', '\\'))
+    fnames = calculate_fnames(p_tracks, base_dir, group_artists=config.GroupArtistsMedia)
+    lines.extend([fname.replace('/', '\\') for fname in fnames])
     return "%s\n" % '\n'.join(lines)
 
 def genQLPlaylist(p_name, p_tracks, base_dir):
-    lines = []
-    call_base_dir = callable(base_dir)
-    for track in p_tracks:
-        if call_base_dir:
-            bd = base_dir(track)
-        else:
-            bd = base_dir
-        lines.append(track.calculate_fname(bd, group_artists=config.GroupArtistsMedia))
+    lines = calculate_fnames(p_tracks, base_dir, group_artists=config.GroupArtistsMedia)
     return "%s\n" % '\n'.join(lines)
 
 def genXSPFPlaylist(p_name, p_tracks, base_dir):
     app_data = list()
     track_str_list = list()
-    call_base_dir = callable(base_dir)
-    for idx, track in enumerate(p_tracks):
-        if call_base_dir:
-            bd = base_dir(track)
-        else:
-            bd = base_dir
-        loc = track.calculate_fname(bd, group_artists=config.GroupArtistsMedia)
+    locs = calculate_fnames(p_tracks, base_dir, group_artists=config.GroupArtistsMedia)
+    for idx, (track, loc) in enumerate(zip(p_tracks, locs)):
         xmlLoc = pathname2xml(loc)
         track_strs = ["\t\t<track>"]
         track_str_dict = [("location", xmlLoc),
@@ -599,7 +652,9 @@ def main():
     parser.add_argument("-v", "--verbose", action="store_true",
             help="Maximize output to the console.")
 
+    trace.add_trace_argument(parser)
     args = parser.parse_args()
+    trace.trace_from_args(args)
 
     if args.verbose:
         debug_level = logging.DEBUG
@@ -642,6 +697,10 @@ def main():
             ps.print_stats(50)
             print(s.getvalue())
 
+    cache = tag_cache()
+    if cache is not None:
+        logging.debug(str(cache))
+
     print(f'Done in {time.time() - now:.5} seconds')
 
 if __name__ == '__main__':
@@ -0,0 +1,33 @@
+"""Benchmark of the change tracking in FileBased: opening many objects, and finding the
+   changes after a single edit."""
+
+import time
+
+from bench.track_getattr import DictDb
+
+num_objects = 50000
+
+def main():
+    rows = [{'title': 'Song %d' % i, 'albumartist': 'Artist', 'tn': i % 10 + 1, 'play_count': 3}
+            for i in range(num_objects)]
+
+    start = time.perf_counter()
+    objects = [DictDb(row) for row in rows]
+    opened = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for obj in objects:
+        obj.changes()
+    unchanged = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for obj in objects:
+        obj.play_count = 4
+        obj.changes()
+    edited = time.perf_counter() - start
+
+    print('%d objects: opened in %.0fms, changes() %.0fms unedited, %.0fms after one edit' %
+          (num_objects, opened * 1e3, unchanged * 1e3, edited * 1e3))
+
+if __name__ == '__main__':
+    main()
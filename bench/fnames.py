@@ -0,0 +1,77 @@
+"""Differential check and benchmark of calculate_fnames against calling calculate_fname on
+   each track, over a generated library with awkward names."""
+
+import itertools
+import random
+import time
+
+from core.metadata import calculate_fnames
+from bench.track_getattr import DictFile, make_tracks
+
+num_albums = 2000
+tracks_per_album = 12
+
+# Fragments that exercise the filtering of path elements
+awkward = ['.', '..', 'a/b', 'AC/DC', '?', ':', '*', '"', '<>', '|', '\\', ' ', 'The ',
+           '.hidden', 'trailing.', '退', 'é', '#', '', 'x' * 150]
+
+def random_name(rng, prefix):
+    return prefix + ''.join(rng.choice(awkward) for _ in range(rng.randint(0, 3)))
+
+def make_library(seed=0):
+    rng = random.Random(seed)
+    files = list()
+    for a in range(num_albums):
+        artist = random_name(rng, rng.choice(['The ', '', '.', '1', 'É']) + 'Artist %d' % (a // 4))
+        album = random_name(rng, 'Album %d' % a)
+        album_artist = rng.choice([None, None, artist, 'Various Artists'])
+        for t in range(tracks_per_album):
+            f = DictFile({'title': rng.choice([None, random_name(rng, 'Song %d' % t)]),
+                          'artist': rng.choice([artist, artist, None]),
+                          'albumartist': album_artist,
+                          'album': rng.choice([album, album, album, None]),
+                          'tracknumber': rng.choice([None, 0, t + 1, t + 1]),
+                          'discnumber': rng.choice([None, None, 1, 2]),
+                          'location': rng.choice([None, '/src/%d-%d.mp3' % (a, t),
+                                                  '/src/%d-%d.flac' % (a, t)])})
+            if rng.random() < 0.05:
+                f.singleton = True
+            files.append(f)
+    rng.shuffle(files)
+    return files
+
+def check(tracks, base_dir, **kwargs):
+    if callable(base_dir):
+        expected = [t.calculate_fname(base_dir(t), **kwargs) for t in tracks]
+    else:
+        expected = [t.calculate_fname(base_dir, **kwargs) for t in tracks]
+    result = calculate_fnames(tracks, base_dir, **kwargs)
+    for t, e, r in zip(tracks, expected, result):
+        assert e == r, (t, e, r)
+    assert len(expected) == len(result)
+
+def main():
+    files = make_library()
+    tracks = make_tracks(2000)
+
+    base_dirs = ['/music', lambda t: '/media/%d' % (len(t.title or '') % 3)]
+    for objs, base_dir, nested, ext, group_artists in itertools.product(
+            [files, tracks], base_dirs, [True, False], [None, '.ogg'], [None, True, False]):
+        check(objs, base_dir, nested=nested, ext=ext, group_artists=group_artists)
+    print('calculate_fnames matches calculate_fname')
+
+    for name, objs in [('generated', files), ('ordinary', make_tracks(len(files)))]:
+        start = time.perf_counter()
+        for t in objs:
+            t.calculate_fname('/music')
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        calculate_fnames(objs, '/music')
+        batch = time.perf_counter() - start
+
+        print('%d %s tracks: %.0fms one at a time, %.0fms batched (%.1fx)' %
+              (len(objs), name, single * 1e3, batch * 1e3, single / batch))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""Generates a synthetic music library for benchmarks: albums of tiny but valid files in every
+   format in mfile.mapping, tagged through the MusicFile classes, along with a matching Quod
+   Libet songs file, Banshee database and playlists."""
+
+import os
+import os.path
+import pickle
+import random
+import sqlite3
+import struct
+import wave
+
+from core.util import pathname2sql
+
+# Words used to make up artist, album and song names
+words = ['Red', 'Blue', 'Night', 'Sun', 'River', 'Glass', 'Echo', 'Iron', 'Velvet', 'Paper',
+         'Silver', 'Ghost', 'Summer', 'Electric', 'Northern', 'Lights', 'Heart', 'Stone',
+         'Machine', 'Garden', 'Ocean', 'Fire', 'Dream', 'Shadow', 'Winter', 'Golden']
+genres = ['Rock', 'Pop', 'Jazz', 'Electronic', 'Classical', 'Folk', 'Metal', 'Hip Hop']
+
+# Length of every generated track, in seconds
+track_length = 1
+
+def _name(rng, n):
+    return ' '.join(rng.choice(words) for _ in range(n))
+
+def make_tags(num_albums, tracks_per_album=10, seed=0):
+    """Returns a list of albums, each a list of tag dicts (with the keys of Metadata.all_keys)
+       for its tracks. Some artists have several albums, some albums several discs, and some
+       album artists differ from the track artists."""
+    rng = random.Random(seed)
+    artists = [rng.choice(['The ', '', '', '']) + _name(rng, 2) for _ in
+               range(max(1, num_albums // 3))]
+    albums = list()
+    for a in range(num_albums):
+        artist = rng.choice(artists).strip()
+        album = '%s %d' % (_name(rng, rng.randint(1, 3)), a)
+        various = rng.random() < 0.1
+        discs = 2 if rng.random() < 0.1 else 1
+        genre = rng.choice(genres)
+        year = rng.randint(1960, 2023)
+        tracks = list()
+        for d in range(discs):
+            for t in range(tracks_per_album):
+                tags = {'title': _name(rng, rng.randint(1, 4)),
+                        'artist': rng.choice(artists).strip() if various else artist,
+                        'album': album,
+                        'album_artist': 'Various Artists' if various else None,
+                        'genre': genre,
+                        'year': year,
+                        'tn': t + 1,
+                        'tc': tracks_per_album}
+                if discs > 1:
+                    tags['dn'], tags['dc'] = d + 1, discs
+                tracks.append(tags)
+        albums.append(tracks)
+    return albums
+
+# Audio payloads
+
+def _ogg_page(serial, sequence, granule, packet, first=False, last=False):
+    from mutagen.ogg import OggPage
+    page = OggPage()
+    page.serial, page.sequence, page.position = serial, sequence, granule
+    page.packets = [packet]
+    page.first, page.last = first, last
+    return page.write()
+
+def _audio_bytes(seed, n):
+    # Different for each track, so their content hashes differ
+    rng = random.Random(seed)
+    return bytes(rng.getrandbits(8) for _ in range(n))
+
+def write_mp3(fname, seed):
+    # Frames of an MPEG-1 layer 3, 128 kbps, 44.1 kHz stream
+    frames = int(track_length * 44100 / 1152)
+    payload = _audio_bytes(seed, 413)
+    with open(fname, 'wb') as fobj:
+        fobj.write((b'\xff\xfb\x90\x00' + payload) * frames)
+
+def write_ogg(fname, seed):
+    ident = b'\x01vorbis' + struct.pack('<IBIiiiBB', 0, 2, 44100, 0, 128000, 0, 0xb8, 1)
+    comment = b'\x03vorbis' + struct.pack('<I', 4) + b'test' + struct.pack('<I', 0) + b'\x01'
+    setup = b'\x05vorbis' + b'\x00' * 32
+    with open(fname, 'wb') as fobj:
+        fobj.write(_ogg_page(1, 0, 0, ident, first=True) + _ogg_page(1, 1, 0, comment) +
+                   _ogg_page(1, 2, 0, setup) +
+                   _ogg_page(1, 3, track_length * 44100, _audio_bytes(seed, 200), last=True))
+
+def write_opus(fname, seed):
+    head = b'OpusHead' + struct.pack('<BBHIhB', 1, 2, 312, 48000, 0, 0)
+    tags = b'OpusTags' + struct.pack('<I', 4) + b'test' + struct.pack('<I', 0)
+    with open(fname, 'wb') as fobj:
+        fobj.write(_ogg_page(1, 0, 0, head, first=True) + _ogg_page(1, 1, 0, tags) +
+                   _ogg_page(1, 2, 312 + track_length * 48000, b'\xfc' + _audio_bytes(seed, 200),
+                             last=True))
+
+def write_flac(fname, seed):
+    # STREAMINFO only: 44.1 kHz, stereo, 16 bits per sample; followed by stand-in frame data
+    info = struct.pack('>HH', 4096, 4096) + b'\x00' * 6
+    info += ((44100 << 44) | (1 << 41) | (15 << 36) | track_length * 44100).to_bytes(8, 'big')
+    info += b'\x00' * 16
+    with open(fname, 'wb') as fobj:
+        fobj.write(b'fLaC' + b'\x80' + len(info).to_bytes(3, 'big') + info +
+                   b'\xff\xf8' + _audio_bytes(seed, 200))
+
+def write_wav(fname, seed):
+    w = wave.open(fname, 'wb')
+    w.setnchannels(2)
+    w.setsampwidth(2)
+    w.setframerate(8000)
+    w.writeframes(_audio_bytes(seed, track_length * 8000 * 4))
+    w.close()
+
+def _atom(name, *children):
+    data = b''.join(children)
+    return struct.pack('>I4s', 8 + len(data), name) + data
+
+def write_m4a(fname, seed):
+    # The atoms mutagen needs to find an AAC audio track, and an mdat holding the audio
+    timescale = 44100
+    duration = track_length * timescale
+    mvhd = _atom(b'mvhd', struct.pack('>B3xIIII', 0, 0, 0, timescale, duration), b'\x00' * 80)
+    tkhd = _atom(b'tkhd', struct.pack('>B3xIIII', 0, 0, 0, 1, 0), b'\x00' * 64)
+    mdhd = _atom(b'mdhd', struct.pack('>B3xIIIIHH', 0, 0, 0, timescale, duration, 0, 0))
+    hdlr = _atom(b'hdlr', struct.pack('>B3xI4s', 0, 0, b'soun'), b'\x00' * 13)
+    mp4a = _atom(b'mp4a', b'\x00' * 6, struct.pack('>H', 1), b'\x00' * 8,
+                 struct.pack('>HHHHI', 2, 16, 0, 0, timescale << 16), _atom(b'free'))
+    stsd = _atom(b'stsd', struct.pack('>B3xI', 0, 1), mp4a)
+    stbl = _atom(b'stbl', stsd)
+    minf = _atom(b'minf', _atom(b'smhd', b'\x00' * 8), stbl)
+    trak = _atom(b'trak', tkhd, _atom(b'mdia', mdhd, hdlr, minf))
+    with open(fname, 'wb') as fobj:
+        fobj.write(_atom(b'ftyp', b'M4A ', struct.pack('>I', 0), b'M4A mp42isom') +
+                   _atom(b'moov', mvhd, trak) + _atom(b'mdat', _audio_bytes(seed, 400)))
+
+writers = {'.mp3': write_mp3, '.ogg': write_ogg, '.opus': write_opus, '.flac': write_flac,
+           '.wav': write_wav, '.m4a': write_m4a}
+
+# Formats WaveFile can't write tags to; these files are only described by the databases
+untagged_exts = frozenset(('.wav',))
+
+def generate_library(music_dir, albums, exts=None):
+    """Writes the tracks of albums (as returned by make_tags) under music_dir, cycling through
+       the formats in exts (by default every format in mfile.mapping) by album. Returns a list
+       of the generated files' locations and tags. WAV files are left untagged."""
+    from mfile import mapping
+    from core.metadata import Metadata
+
+    if exts is None:
+        exts = sorted(mapping.keys())
+    library = list()
+    for i, tracks in enumerate(albums):
+        ext = exts[i % len(exts)]
+        for tags in tracks:
+            md = Metadata.from_dict(tags)
+            fname = md.calculate_fname(music_dir, ext=ext)
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            writers[ext](fname, len(library))
+            if ext not in untagged_exts:
+                mfile = mapping[ext](fname)
+                for k, v in tags.items():
+                    if v is not None:
+                        setattr(mfile, k, v)
+                mfile.save()
+            library.append((fname, tags))
+    return library
+
+def write_ql_songs(fname, library, seed=0):
+    """Writes a Quod Libet songs file for library, with random play counts. Uses Quod Libet to
+       write it if it can be imported, and a pickled list of dicts otherwise."""
+    rng = random.Random(seed)
+    songs = list()
+    for loc, tags in library:
+        song = {'~filename': loc, 'title': tags['title'], 'artist': tags['artist'],
+                'album': tags['album'], 'genre': tags['genre'], 'date': str(tags['year']),
+                'tracknumber': '%d/%d' % (tags['tn'], tags['tc']),
+                '~#playcount': rng.choice([0, 0, rng.randint(1, 100)]),
+                '~#skipcount': rng.randint(0, 3), '~#rating': rng.choice([0.5, 0.8, 1.0]),
+                '~#length': track_length, '~#filesize': os.path.getsize(loc),
+                '~#added': 1.6e9 + rng.randint(0, 10 ** 8)}
+        if tags.get('album_artist'):
+            song['albumartist'] = tags['album_artist']
+        if tags.get('dn'):
+            song['discnumber'] = '%d/%d' % (tags['dn'], tags['dc'])
+        songs.append(song)
+
+    try:
+        from quodlibet.formats import dump_audio_files
+        from quodlibet.formats._audio import AudioFile
+        data = dump_audio_files([AudioFile(song) for song in songs])
+    except ImportError:
+        data = pickle.dumps(songs, protocol=2)
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    with open(fname, 'wb') as fobj:
+        fobj.write(data)
+
+def write_banshee_db(fname, library, playlists, seed=0):
+    """Writes a Banshee database holding library, and playlists (a mapping from names to lists
+       of indices into library), with the tables and columns db.banshee reads."""
+    rng = random.Random(seed)
+    if os.path.exists(fname):
+        os.remove(fname)
+    conn = sqlite3.connect(fname)
+    conn.executescript("""
+        CREATE TABLE CoreArtists (ArtistID INTEGER PRIMARY KEY, Name TEXT, NameSort TEXT);
+        CREATE TABLE CoreAlbums (AlbumID INTEGER PRIMARY KEY, ArtistID INTEGER, Title TEXT,
+            TitleSort TEXT, ArtistName TEXT, ArtistNameSort TEXT);
+        CREATE TABLE CoreTracks (TrackID INTEGER PRIMARY KEY, ArtistID INTEGER, AlbumID INTEGER,
+            Title TEXT, TitleSort TEXT, Genre TEXT, Year INTEGER, TrackNumber INTEGER,
+            TrackCount INTEGER, Disc INTEGER, DiscCount INTEGER, Uri TEXT, Duration INTEGER,
+            BitRate INTEGER, Rating INTEGER, PlayCount INTEGER, SkipCount INTEGER,
+            DateAddedStamp INTEGER, LastPlayedStamp INTEGER, LastSkippedStamp INTEGER,
+            FileSize INTEGER);
+        CREATE INDEX CoreTracksUriIndex ON CoreTracks(Uri);
+        CREATE TABLE CorePlaylists (PlaylistID INTEGER PRIMARY KEY, Name TEXT);
+        CREATE TABLE CorePlaylistEntries (EntryID INTEGER PRIMARY KEY, PlaylistID INTEGER,
+            TrackID INTEGER, ViewOrder INTEGER);
+        CREATE TABLE CoreSmartPlaylists (SmartPlaylistID INTEGER PRIMARY KEY, Name TEXT);
+        CREATE TABLE CoreSmartPlaylistEntries (EntryID INTEGER PRIMARY KEY,
+            SmartPlaylistID INTEGER, TrackID INTEGER);
+        """)
+    artist_ids = dict()
+    album_ids = dict()
+    for i, (loc, tags) in enumerate(library):
+        artist = tags['artist']
+        if artist not in artist_ids:
+            artist_ids[artist] = len(artist_ids) + 1
+            conn.execute('INSERT INTO CoreArtists VALUES (?, ?, NULL)', (artist_ids[artist], artist))
+        album_key = (tags['album'], tags.get('album_artist') or artist)
+        if album_key not in album_ids:
+            album_ids[album_key] = len(album_ids) + 1
+            conn.execute('INSERT INTO CoreAlbums VALUES (?, ?, ?, NULL, ?, NULL)',
+                         (album_ids[album_key], artist_ids[artist], album_key[0], album_key[1]))
+        conn.execute('INSERT INTO CoreTracks VALUES (%s)' % ', '.join(['?'] * 21),
+                     (i + 1, artist_ids[artist], album_ids[album_key], tags['title'], None,
+                      tags['genre'], tags['year'], tags['tn'], tags['tc'], tags.get('dn'),
+                      tags.get('dc'), pathname2sql(loc), track_length * 1000, 128,
+                      rng.randint(0, 5), rng.randint(0, 100), rng.randint(0, 3),
+                      1600000000 + rng.randint(0, 10 ** 8), None, None,
+                      os.path.getsize(loc)))
+    for p, (name, indices) in enumerate(sorted(playlists.items())):
+        conn.execute('INSERT INTO CorePlaylists VALUES (?, ?)', (p + 1, name))
+        conn.executemany('INSERT INTO CorePlaylistEntries (PlaylistID, TrackID, ViewOrder) '
+                         'VALUES (?, ?, ?)', [(p + 1, i + 1, n) for n, i in enumerate(indices)])
+    conn.commit()
+    conn.close()
+
+def make_playlists(library, num_playlists=4, seed=0):
+    """Returns a mapping from playlist names to lists of indices into library."""
+    rng = random.Random(seed)
+    return dict([('Playlist %d' % p, sorted(rng.sample(range(len(library)),
+                                                     min(len(library), len(library) // 3 + 1))))
+                 for p in range(num_playlists)])
+
+def write_ql_playlists(playlists_dir, library, playlists):
+    """Writes playlists in Quod Libet's format (one location per line) to playlists_dir."""
+    os.makedirs(playlists_dir, exist_ok=True)
+    for name, indices in playlists.items():
+        with open(os.path.join(playlists_dir, name), 'w') as fobj:
+            fobj.write(''.join(['%s\n' % library[i][0] for i in indices]))
+
+def main():
+    import sys
+    import time
+
+    music_dir = sys.argv[1]
+    num_albums = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    start = time.perf_counter()
+    library = generate_library(music_dir, make_tags(num_albums))
+    print('Generated %d tracks in %s in %.1fs' % (len(library), music_dir,
+                                                  time.perf_counter() - start))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+"""Micro-benchmark of getting and setting keys on a MappingWrapper subclass."""
+
+import timeit
+
+from bench.track_getattr import DictFile
+
+# Number of times to run each statement per measurement
+number = 200000
+
+statements = ('m.title',
+              'm.genre',
+              'm.tnc',
+              "m.title = 'New Title'",
+              'm.tn = 3',
+              'm.album_artist')
+
+def main():
+    m = DictFile({'title': 'Title', 'artist': 'Artist', 'tn': 1, 'tc': 2})
+    for stmt in statements:
+        t = min(timeit.repeat(stmt, globals={'m': m}, number=number, repeat=5)) / number
+        print('%-24s %.3fus' % (stmt, t * 1e6))
+
+if __name__ == '__main__':
+    main()
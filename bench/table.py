@@ -0,0 +1,67 @@
+"""Differential check and benchmark of LibraryTable's filter, sort and group_counts against
+   the equivalent loops over the metadata objects."""
+
+import collections
+import random
+import time
+
+from core.util import sort_key
+from db.table import LibraryTable
+from bench.track_getattr import DictDb
+
+num_tracks = 50000
+
+def make_library(seed=0):
+    rng = random.Random(seed)
+    objects = list()
+    for i in range(num_tracks):
+        album = i // 12
+        objects.append(DictDb({'title': 'Song %d' % i,
+                               'artist': rng.choice(['Artist %d' % (album // 5), '', None]),
+                               'albumartist': rng.choice([None, None, '', 'Various Artists']),
+                               'album': rng.choice(['Album %d' % album, 'Album %d' % album, None]),
+                               'tracknumber': rng.choice([None, 0, i % 12 + 1, i % 12 + 1]),
+                               'discnumber': rng.choice([None, 0, 1, 2]),
+                               'play_count': rng.choice([None, 0, rng.randint(1, 50)])}))
+    rng.shuffle(objects)
+    return objects
+
+def timed(f):
+    start = time.perf_counter()
+    result = f()
+    return result, time.perf_counter() - start
+
+def main():
+    objects = make_library()
+    table, load = timed(lambda: LibraryTable(objects))
+    print('Built a table of %d tracks in %.0fms' % (len(table), load * 1e3))
+
+    for keys in [(), ('artist', 'tn'), ('album', 'dn')]:
+        expected, loop = timed(lambda: sorted(objects, key=sort_key(*keys)))
+        result, vectorized = timed(lambda: table.sort(*keys))
+        assert result.rows() == expected
+        print('sort%r: %.0fms looping, %.0fms in the table' % (keys, loop * 1e3, vectorized * 1e3))
+
+    for conditions, test in [({'album': 'Album 7'}, lambda o: o.album == 'Album 7'),
+                             ({'dn': None}, lambda o: o.dn is None),
+                             ({'play_count': lambda v: v > 25, 'tn': (1, 2, None)},
+                              lambda o: o.play_count is not None and o.play_count > 25 and
+                                        o.tn in (1, 2, None))]:
+        expected, loop = timed(lambda: [o for o in objects if test(o)])
+        result, vectorized = timed(lambda: table.filter(**conditions))
+        assert result.rows() == expected
+        print('filter(%s): %.0fms looping, %.0fms in the table' %
+              (', '.join(sorted(conditions)), loop * 1e3, vectorized * 1e3))
+
+    expected, loop = timed(lambda: collections.Counter([(o.album, o.dn) for o in objects]))
+    result, vectorized = timed(table.group_counts)
+    assert result == dict(expected)
+    print('group_counts: %.0fms looping, %.0fms in the table' % (loop * 1e3, vectorized * 1e3))
+
+    tracks = table.filter(album='Album 7').sort().tracks()
+    assert [t.title for t in tracks] == [o.title for o in
+                                         sorted([o for o in objects if o.album == 'Album 7'],
+                                                key=sort_key())]
+
+if __name__ == '__main__':
+    main()
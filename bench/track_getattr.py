@@ -0,0 +1,78 @@
+"""Micro-benchmark of attribute access on Track objects, with and without the cache of
+   resolved values."""
+
+import time
+
+from core.file_based import FileBased
+from core.track import Track
+from core.util import sort_key
+from db.db import MusicDb
+from mfile.mfile import MusicFile
+
+# Number of tracks to create, and number of times to repeat each test
+num_tracks = 10000
+repeats = 5
+
+class DictFile(FileBased):
+    all_keys = MusicFile.all_keys
+
+class DictDb(FileBased):
+    all_keys = MusicDb.all_keys
+
+def make_tracks(n=num_tracks):
+    tracks = list()
+    for i in range(n):
+        # The file lacks some values, so lookups have to fall through to the db
+        mfile = DictFile({'title': 'Song %d' % i,
+                          'artist': 'Artist %d' % (i // 100),
+                          'album': 'Album %d' % (i // 10),
+                          'tn': i % 10 + 1,
+                          'location': '/music/%d.ogg' % i})
+        db = DictDb({'title': 'Song %d' % i,
+                     'albumartist': 'Artist %d' % (i // 100),
+                     'dn': 1,
+                     'play_count': i % 7})
+        tracks.append(Track(mfile, db))
+    return tracks
+
+def time_access(tracks, keys, uncached):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for track in tracks:
+            for key in keys:
+                if uncached:
+                    track._invalidate()
+                getattr(track, key)
+    return (time.perf_counter() - start) / (repeats * len(tracks) * len(keys))
+
+def time_sort(tracks, uncached):
+    key_func = sort_key()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        if uncached:
+            for track in tracks:
+                track._invalidate()
+        sorted(tracks, key=key_func)
+    return (time.perf_counter() - start) / repeats
+
+def main():
+    tracks = make_tracks()
+    keys = ('title', 'album_artist', 'album', 'dn', 'tn', 'play_count', 'year')
+
+    uncached = time_access(tracks, keys, True)
+    cached = time_access(tracks, keys, False)
+    print('getattr: %.2fus uncached, %.2fus cached (%.1fx)' %
+          (uncached * 1e6, cached * 1e6, uncached / cached))
+
+    uncached = time_sort(tracks, True)
+    cached = time_sort(tracks, False)
+    print('sort of %d tracks: %.1fms uncached, %.1fms cached (%.1fx)' %
+          (len(tracks), uncached * 1e3, cached * 1e3, uncached / cached))
+
+    # Make sure changes are seen through the cache
+    track = tracks[0]
+    track.mfile.title = 'Changed'
+    assert track.title == 'Changed'
+
+if __name__ == '__main__':
+    main()
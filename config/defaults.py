@@ -13,12 +13,21 @@ MediaDir = os.path.join('/media', getpass.getuser())
 BaseDevices = ["ROOT"]
 # Banshee DB location
 BansheeDbLoc = os.path.expanduser(os.path.join('~', '.config', 'banshee-1', 'banshee.db'))
+# Bytes of the Banshee DB to memory-map when reading it (0 disables memory-mapping)
+BansheeMmapSize = 256 * 2 ** 20
+# Size (in KB) of the page cache used when reading the Banshee DB
+BansheeCacheSize = 64 * 1024
 # Quod Libet songs file location
 QLSongsLoc = os.path.expanduser(os.path.join('~', '.quodlibet', 'songs'))
 # Quod Libet playlist file location
 QLPlaylistsLoc = os.path.expanduser(os.path.join('~', '.quodlibet', 'playlists'))
 # Directory to check for playlists on a portable player
 PortablePLsDir = 'PlaylistsQL'
+# Location of the cache of tags read from music files (set to None to disable the cache)
+TagCacheLoc = os.path.expanduser(os.path.join('~', '.cache', 'pyBansheeScripts', 'tags.db'))
+# Directory in which to keep transcoded files so that the same source is only encoded once
+# (set to None to disable the cache)
+TranscodeCacheDir = os.path.expanduser(os.path.join('~', '.cache', 'pyBansheeScripts', 'transcoded'))
 
 # Library backup settings for RunQL.py
 # Number of pre/post backups to maintain
@@ -67,6 +76,11 @@ GroupSingletons = True
 # 2 = Update any files that are newer in the source than in the destination
 # 3 = Update any files whose modification times don't match
 SyncLevel = 2
+# When a file to update on a player differs from its source only in its tags (determined by
+# hashing their audio), rewrite the tags on the player instead of copying the whole file.
+# Files whose changed tags include any that aren't metadata keys (e.g. embedded art or
+# ReplayGain) are still copied
+SyncRetagOnly = True
 # Timestamp format for display
 TsFmt = "%Y-%m-%d %H:%M:%S"
 # album_artist defaults to artist if not specified
@@ -75,18 +89,29 @@ AlbumArtistDefault = True
 def DefaultDb():
     from db.ql import QLDb
     return QLDb
+# Evaluate Quod Libet smart playlist queries in-process instead of running quodlibet for each
+# one (queries using unsupported syntax are still run by quodlibet)
+QLNativeQueries = True
 # Default bit rate to encode arbitrary tracks to
 DefaultBitrate = 128
 # Default bit rate to encode CDs to
 DefaultCDBitrate = 256
-# Default file type to encode to (.mp3 or .ogg)
+# Default file type to encode to (.mp3, .ogg, .opus, .flac or .m4a)
 DefaultEncodeExt = ".ogg"
 # Default source to use when opening track metadata from filenames. Select 'db' or 'mfile'.
 DefaultMetadataSource = 'mfile'
 # Default MP3 quality (0 <= qual <= 9, lower is better)
 MP3Qual = 2
+# Padding (in KB) to reserve for future tag edits when saving tags requires rewriting a file.
+# Tag edits that fit in a file's existing padding are always written in place.
+TagPaddingKB = 16
 # Default FLAC encoding compression level (0 <= level <= 8; lower is faster, higher is more compressed)
 FlacCompLevel = 5
+# Maximum total size (in MB) of the transcode cache; the least recently used files are removed first
+TranscodeCacheSizeMB = 2048
+# Hard link files from the transcode cache instead of copying them. This is faster and saves space,
+# but editing a linked file's tags in place also changes the cached copy.
+TranscodeCacheLink = False
 # File list extension
 FileListExt = '.fl'
 # Extensions for album artwork--lowercase
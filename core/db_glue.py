@@ -3,19 +3,153 @@
 import sqlite3 as sql
 import os
 import operator
+import threading
+import urllib.parse
+import weakref
 
-def new(loc):
-    """Returns a new cursor to the database. (Creates the database if none exists)"""
-    db = DB(loc)
+from core.trace import traced
+
+# Number of rows fetched at a time by DB.iter_sql
+fetch_batch_size = 1000
+
+def new(loc, read_only=False, pragmas=None, wal=False, **kwargs):
+    """Returns a new cursor to the database. (Creates the database if none exists, unless
+       read_only is True.) pragmas is a mapping from names of pragmas to set on the connection
+       to their values. If wal is True, the database is switched to write-ahead logging, which
+       lets it be read while it is being written to. Extra keyword arguments are passed on to
+       sqlite3.connect."""
+    if read_only:
+        loc = 'file:%s?mode=ro' % urllib.parse.quote(os.path.abspath(loc))
+        kwargs['uri'] = True
+    db = DB(loc, **kwargs)
+    if wal:
+        db.sql('PRAGMA journal_mode = WAL')
+    for name, value in (pragmas or {}).items():
+        db.sql('PRAGMA %s = %s' % (name, value))
     return db
 
+class ConnectionPool(object):
+    """Connections to a database shared between threads. Each thread reads through its own
+       connection, so reads don't wait for each other; all writes go through a single writer
+       connection, one at a time. Reads don't see writes until they are committed. The database
+       is put in WAL mode so that reads aren't blocked by the writer either.
+
+       Connections are not shared with forked processes; a process gets new ones the first
+       time it uses the pool."""
+
+    def __init__(self, loc, wal=True, **kwargs):
+        self.loc = loc
+        self.wal = wal
+        self.kwargs = kwargs
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._local = threading.local()
+        # Connections of threads that have exited are closed when they are garbage collected
+        self._connections = weakref.WeakSet()
+        self._writer = None
+
+    def _connect(self):
+        db = new(self.loc, wal=self.wal, check_same_thread=False, **self.kwargs)
+        with self._lock:
+            self._connections.add(db)
+        return db
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # Leave the parent process's connections alone
+            self._reset()
+
+    def reader(self):
+        """Returns the calling thread's connection."""
+        self._check_pid()
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = self._connect()
+        return db
+
+    def writer(self):
+        """Returns the writer connection. Hold write_lock() while using it."""
+        self._check_pid()
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            return self._writer
+
+    def write_lock(self):
+        return self._write_lock
+
+    def sql(self, sqlstr, *args, **kwargs):
+        """Runs a query on the calling thread's connection. Use write() for statements that
+           change the database."""
+        return self.reader().sql(sqlstr, *args, **kwargs)
+
+    def iter_sql(self, sqlstr, *args, **kwargs):
+        return self.reader().iter_sql(sqlstr, *args, **kwargs)
+
+    def write(self, sqlstr, *args, **kwargs):
+        """Runs a statement changing the database on the writer connection."""
+        with self._write_lock:
+            return self.writer().sql(sqlstr, *args, **kwargs)
+
+    def write_many(self, sqlstr, parms_seq):
+        with self._write_lock:
+            return self.writer().sql_many(sqlstr, parms_seq)
+
+    def commit(self):
+        with self._write_lock:
+            if self._writer is not None and self._pid == os.getpid():
+                self._writer.commit()
+
+    def close(self):
+        with self._write_lock, self._lock:
+            if self._pid == os.getpid():
+                for db in list(self._connections):
+                    db.close()
+            self._reset()
+
+class LazyDB(object):
+    """Stands in for a DB, connecting to the database the first time it is used. The
+       connection is read-only until writable() is called, which reopens it for writing."""
+
+    def __init__(self, loc, pragmas=None):
+        self.loc = loc
+        self.pragmas = pragmas
+        self._db = None
+        self._read_only = True
+
+    def _connect(self):
+        if self._db is None:
+            self._db = new(self.loc, self._read_only, self.pragmas)
+        return self._db
+
+    def __getattr__(self, name):
+        return getattr(self._connect(), name)
+
+    def writable(self):
+        """Returns the DB, reconnecting to it for writing if it was opened read-only."""
+        if self._read_only:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+            self._read_only = False
+        return self._connect()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
 class DB:
     """An object representing a cursor to a database."""
 
-    __slots__ = ('conn', 'curs')
+    __slots__ = ('conn', 'curs', '__weakref__')
 
-    def __init__(self, path):
-        self.conn = sql.connect(path)
+    def __init__(self, path, **kwargs):
+        self.conn = sql.connect(path, **kwargs)
         self.curs = self.conn.cursor()
 
     def __enter__(self):
@@ -56,10 +190,8 @@ class DB:
         return self.sql("SELECT last_insert_rowid() AS id")[0]["id"]
 
     def pack_rows(self, desc, rows):
-        result = list()
-        for row in rows:
-            result.append(dict(((desc[i][0], row[i]) for i in range(len(desc)))))
-        return result
+        names = [d[0] for d in desc]
+        return [dict(zip(names, row)) for row in rows]
 
     def preview_sql(self, sqlstr, *args, **kwargs):
         quoted_args = []
@@ -88,6 +220,7 @@ class DB:
         quoted = self.curs.fetchone()[0]
         return str(quoted)
 
+    @traced('sql')
     def sql(self, sqlstr, *args, **kwargs):
         """Executes the sql in the string, returns results (if any) as a list of
             dicts."""
@@ -104,6 +237,36 @@ class DB:
         else:
             return self.pack_rows(self.curs.description, self.curs.fetchall())
 
+    def iter_sql(self, sqlstr, *args, batch_size=fetch_batch_size, **kwargs):
+        """Executes the sql in the string, yields the results as sqlite3.Row objects (which
+            can be indexed by column name or position), fetching batch_size rows at a time.
+            Uses its own cursor, so other statements can be run while iterating."""
+        if args and kwargs:
+            raise ValueError("Cannot specify both args and kwargs")
+        if args:
+            parms = args
+        else:
+            parms = kwargs
+
+        curs = self.conn.cursor()
+        curs.row_factory = sql.Row
+        try:
+            curs.execute(sqlstr, parms)
+            while True:
+                rows = curs.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            curs.close()
+
+    @traced('sql_many')
+    def sql_many(self, sqlstr, parms_seq):
+        """Executes the sql in the string once for each set of parameters in parms_seq (each a
+            sequence or a dict), returns the number of rows changed."""
+        self.curs.executemany(sqlstr, parms_seq)
+        return self.curs.rowcount
+
     def update(self, table, id_cols, nonid_cols):
         ids = id_cols.copy()
         nonids = nonid_cols.copy()
@@ -7,6 +7,9 @@ import config
 class FormattingDictLike(abc.ABC):
     sigil = ' '
 
+    # Allows subclasses to define __slots__
+    __slots__ = ()
+
     all_keys = ()
     format_lines = []
 
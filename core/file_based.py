@@ -6,26 +6,60 @@ class FileBased(Metadata):
        media file or a database file). Automatically keeps track of changes to
        metadata."""
 
+    # Groups of keys whose values depend on each other, so changing one can change the others.
+    # Keys stored under the same mapped key are linked automatically.
+    linked_keys = [('tn', 'tc', 'tnc'),
+                   ('dn', 'dc', 'dnc'),
+                   ('artist', 'album_artist')]
+
     def __init__(self, d):
         super(FileBased, self).__init__(d)
         self._copy_changes()
 
     def changes(self):
         """Returns the changes that have been made to the object, as the difference
-           between the current state and the staged copy."""
+           between the current state and the staged values of the keys that were set or
+           deleted."""
         changes = dict()
-        current_state = self.to_dict()
-        for k, v in current_state.items():
-            if v != self.staged.get(k, None):
-                changes[k] = v
-        for k in self.staged.keys():
-            if k not in current_state:
-                changes[k] = None
+        for k, v in self.staged.items():
+            current = getattr(self, k)
+            if current != v:
+                changes[k] = current
 
         return changes
 
     def _copy_changes(self):
-        self.staged = self.to_dict()
+        # The staged value of a key is only recorded when it is first changed (see _touch)
+        self.staged = dict()
+
+    def _touch(self, key):
+        # Record the values of key and the keys linked to it before it is changed
+        staged = self.staged
+        if key not in staged:
+            for k in self._linked[key]:
+                if k not in staged:
+                    staged[k] = getattr(self, k)
+
+    @classmethod
+    def _compile_accessors(cls):
+        # Called while the class is being created, before the name FileBased is bound
+        super()._compile_accessors()
+
+        # Collect the groups of linked keys, merging any that overlap
+        groups = [set(group) & set(cls.all_keys) for group in cls.linked_keys]
+        keys_by_mapped = dict()
+        for key, mapped_key in cls._mapped_keys.items():
+            keys_by_mapped.setdefault(mapped_key, set()).add(key)
+        groups.extend(keys_by_mapped.values())
+
+        linked = dict([(key, {key}) for key in cls.all_keys])
+        for group in groups:
+            merged = set(group)
+            for key in group:
+                merged |= linked[key]
+            for key in merged:
+                linked[key] = merged
+        cls._linked = dict([(key, tuple(sorted(group))) for key, group in linked.items()])
 
     def save(self):
         """Copies all current changes over to the staged copy, then writes them to
@@ -33,6 +67,8 @@ class FileBased(Metadata):
         changes = self.changes()
         self._copy_changes()
         self._save(changes)
+        # Saving can change values that weren't set, e.g. the file size and bitrate
+        self._notify()
         return len(changes) > 0
 
     def _save(self, changes):
@@ -42,4 +78,3 @@ class FileBased(Metadata):
            For objects backed by a database, writes changes to the database.
            The commit() method must then be called to save the database."""
         raise NotImplementedError
-
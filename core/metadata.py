@@ -4,7 +4,8 @@ import os.path
 import config
 from core.mw import MappingWrapper
 from core.fd import FormattingDictLike
-from core.util import filter_path_elements, value_is_none, get_sort_char
+from core.trace import traced
+from core.util import filter_path_elements, filter_path_element, value_is_none, get_sort_char
 
 NOT_FOUND = object()
 
@@ -79,6 +80,7 @@ class Metadata(MappingWrapper, FormattingDictLike):
                 setattr(inst, k, v)
         return inst
 
+    @traced('calculate_fname')
     def calculate_fname(self, base_dir=config.MusicDir, nested=True, ext=None,
                         group_artists=None):
         if ext is None:
@@ -191,3 +193,64 @@ class Metadata(MappingWrapper, FormattingDictLike):
     def dnc(self):
         del self.dn
         del self.dc
+
+@traced('calculate_fnames')
+def calculate_fnames(tracks, base_dir=config.MusicDir, nested=True, ext=None,
+                     group_artists=None):
+    """Returns the result of calling calculate_fname with these arguments on each of tracks
+       (Metadata objects or Tracks), sharing the work for tracks in the same directory.
+       base_dir may also be a function returning the base directory for a track."""
+    if group_artists is None:
+        group_artists = config.GroupArtists
+    call_base_dir = callable(base_dir)
+
+    # (base directory, artist, album, singleton) -> sanitized directory
+    dirs = dict()
+    fnames = list()
+    for track in tracks:
+        # Tracks delegate calculate_fname to their default metadata
+        md = track if isinstance(track, Metadata) else track.default_metadata
+        bd = base_dir(track) if call_base_dir else base_dir
+
+        if ext is None:
+            if getattr(md, 'location', None) is not None:
+                track_ext = os.path.splitext(md.location)[1]
+            else:
+                track_ext = config.DefaultEncodeExt
+        else:
+            track_ext = ext
+
+        artist = md.album_artist or md.artist or 'Unknown Artist'
+        album = md.album or 'Unknown Album'
+        singleton = getattr(md, 'singleton', False) and config.GroupSingletons
+
+        key = (bd, artist, album, singleton)
+        d = dirs.get(key, None)
+        if d is None:
+            d = bd
+            if group_artists and not singleton:
+                d = os.path.join(d, get_sort_char(artist))
+            if singleton:
+                d = os.path.join(d, filter_path_elements(["Singletons"]))
+            elif nested:
+                d = os.path.join(d, filter_path_elements([artist, album]))
+            dirs[key] = d
+
+        tn = ''
+        if config.NumberTracks:
+            tn_num = md.tn
+            if tn_num not in (0, None):
+                dn = md.dn
+                if dn:
+                    tn = "%d-%02d " % (dn, tn_num)
+                else:
+                    tn = "%02d " % tn_num
+
+        fname = os.path.join(d, filter_path_element("%s%s%s" % (tn, md.title or 'Unknown Song',
+                                                                 track_ext)))
+        if len(fname) > 255:
+            # Needs shortening
+            fname = md.calculate_fname(bd, nested, ext, group_artists)
+        fnames.append(fname)
+
+    return fnames
@@ -1,3 +1,5 @@
+import weakref
+
 class NotAllowedError(Exception):
     pass
 
@@ -18,6 +20,31 @@ class MappingWrapper(object):
     def set_dict(self, d):
         self.wrapped = d
 
+    def add_listener(self, callback):
+        """Registers a bound method to be called (with no arguments) whenever one of this
+           object's keys is set or deleted, or it is saved. Only a weak reference to it is kept."""
+        self.__dict__.setdefault('_listeners', []).append(weakref.WeakMethod(callback))
+
+    def _touch(self, key):
+        """Called before a key is set or deleted."""
+        pass
+
+    def _notify(self):
+        listeners = self.__dict__.get('_listeners', None)
+        if listeners:
+            for ref in listeners[:]:
+                callback = ref()
+                if callback is None:
+                    listeners.remove(ref)
+                else:
+                    callback()
+
+    def __getstate__(self):
+        # Listeners can't be pickled, and belong to objects in this process anyway
+        state = self.__dict__.copy()
+        state.pop('_listeners', None)
+        return state
+
     def _map_key(self, key):
         return self.mapping.get(key, key)
 
@@ -31,34 +58,73 @@ class MappingWrapper(object):
         del self.wrapped[key]
 
     def __getattr__(self, key):
-        if key in self.all_keys:
-            mapped_key = self._map_key(key)
-            return self.get_item(mapped_key)
-        else:
+        # Only called for keys without a descriptor
+        try:
+            mapped_key = self._mapped_keys[key]
+        except KeyError:
             return super(MappingWrapper, self).__getattribute__(key)
+        return self.get_item(mapped_key)
 
     def __setattr__(self, key, value):
-        if key in self.all_keys:
-            if key in self.read_only_keys:
-                raise NotAllowedError('%s is read-only' % key)
-            # __setattr__ takes priority over descriptors, so we have to check if we need to use one
-            if isinstance(getattr(self.__class__, key, None), property):
-                super(MappingWrapper, self).__setattr__(key, value)
-            else:
-                mapped_key = self._map_key(key)
-                self.set_item(mapped_key, value)
-        else:
+        setter = self._setters.get(key, None)
+        if setter is None:
             super(MappingWrapper, self).__setattr__(key, value)
+        else:
+            self._touch(key)
+            setter(self, value)
+            self._notify()
 
     def __delattr__(self, key):
-        if key in self.all_keys:
-            if key in self.read_only_keys:
-                raise NotAllowedError('%s is read-only' % key)
-            # __delattr__ takes priority over descriptors, so we have to check if we need to use one
-            if isinstance(getattr(self.__class__, key, None), property):
-                super(MappingWrapper, self).__delattr__(key)
-            else:
-                mapped_key = self._map_key(key)
-                self.del_item(mapped_key)
-        else:
+        deleter = self._deleters.get(key, None)
+        if deleter is None:
             super(MappingWrapper, self).__delattr__(key)
+        else:
+            self._touch(key)
+            deleter(self)
+            self._notify()
+
+    # Accessor tables
+
+    # Mapping from each key to the key it is stored under, and to functions setting and
+    # deleting it; built for each subclass when it is defined
+    _mapped_keys = {}
+    _setters = {}
+    _deleters = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super(MappingWrapper, cls).__init_subclass__(**kwargs)
+        cls._compile_accessors()
+
+    @classmethod
+    def _compile_accessors(cls):
+        """Resolves the mapping, read-only keys and descriptors of every key up front, so that
+           accessing one is a single lookup in these tables."""
+        cls._mapped_keys = dict()
+        cls._setters = dict()
+        cls._deleters = dict()
+        for key in cls.all_keys:
+            mapped_key = cls.mapping.get(key, key)
+            cls._mapped_keys[key] = mapped_key
+            attr = getattr(cls, key, None)
+            if key in cls.read_only_keys:
+                cls._setters[key] = cls._deleters[key] = _read_only_accessor(key)
+            # __setattr__ takes priority over descriptors, so they have to be called directly
+            elif isinstance(attr, property):
+                cls._setters[key] = attr.__set__
+                cls._deleters[key] = attr.__delete__
+            else:
+                cls._setters[key], cls._deleters[key] = _item_accessors(mapped_key)
+
+def _read_only_accessor(key):
+    def read_only(self, *args):
+        raise NotAllowedError('%s is read-only' % key)
+    return read_only
+
+def _item_accessors(mapped_key):
+    def set_(self, value):
+        self.set_item(mapped_key, value)
+
+    def del_(self):
+        self.del_item(mapped_key)
+
+    return set_, del_
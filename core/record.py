@@ -0,0 +1,143 @@
+import sys
+
+from core.fd import FormattingDictLike
+from core.mw import NotAllowedError
+from db.db import MusicDb
+
+# Fields stored in a TrackRecord; tnc and dnc are derived from the number/count fields
+record_keys = tuple([k for k in MusicDb.all_keys if k not in MusicDb.derived_keys])
+
+# String fields whose values repeat across many tracks; these are interned so each distinct
+# value is only stored once
+interned_keys = frozenset(('artist', 'album', 'album_artist', 'genre', 'performer', 'grouping'))
+
+class TrackRecord(FormattingDictLike):
+    """Immutable, compact snapshot of a track's metadata (the fields of Metadata.all_keys plus
+       the MusicDb fields). Use these instead of MusicFile/MusicDb objects when loading a whole
+       library just to read it; to_mfile() and to_db() open the full objects for editing."""
+
+    sigil = '-'
+
+    __slots__ = record_keys + ('source',)
+
+    all_keys = record_keys + tuple(MusicDb.derived_keys)
+    format_lines = MusicDb.format_lines
+
+    def __init__(self, source=None, **values):
+        for k in record_keys:
+            v = values.pop(k, None)
+            if k in interned_keys and isinstance(v, str):
+                v = sys.intern(v)
+            object.__setattr__(self, k, v)
+        if values:
+            raise TypeError('Unknown TrackRecord fields: %s' % ', '.join(sorted(values)))
+        # The class (MusicDb subclass or MusicFile subclass) this record was read from
+        object.__setattr__(self, 'source', source)
+
+    @classmethod
+    def from_metadata(cls, md):
+        """Takes a snapshot of any Metadata (or Track) object."""
+        return cls(md.__class__, **dict([(k, getattr(md, k, None)) for k in record_keys]))
+
+    def __setattr__(self, key, value):
+        raise NotAllowedError('TrackRecord is read-only')
+
+    def __delattr__(self, key):
+        raise NotAllowedError('TrackRecord is read-only')
+
+    def __getstate__(self):
+        return tuple([getattr(self, k) for k in self.__slots__])
+
+    def __setstate__(self, state):
+        for k, v in zip(self.__slots__, state):
+            object.__setattr__(self, k, v)
+
+    def __eq__(self, other):
+        if not isinstance(other, TrackRecord):
+            return NotImplemented
+        return self.__getstate__()[:-1] == other.__getstate__()[:-1]
+
+    def __hash__(self):
+        return hash(self.__getstate__()[:-1])
+
+    def to_dict(self):
+        return dict([(k, getattr(self, k)) for k in self.all_keys])
+
+    def to_mfile(self):
+        """Opens the music file this record describes."""
+        from mfile import open_music_file
+        return open_music_file(self.location)
+
+    def to_db(self):
+        """Loads the full database entry for this record, from the database it was read from if
+           that is known and from the default database otherwise."""
+        if isinstance(self.source, type) and issubclass(self.source, MusicDb):
+            return self.source.from_file(self.location)
+        from db import open_db
+        return open_db(self.location)
+
+    def __str__(self):
+        return '%s<%s, %s, %s>' % (self.__class__.__name__, self.title, self.artist, self.album)
+
+    # Properties
+
+    @property
+    def tnc(self):
+        return (self.tn, self.tc)
+
+    @property
+    def dnc(self):
+        return (self.dn, self.dc)
+
+    @property
+    def album_artist_or_artist(self):
+        return self.album_artist or self.artist
+
+def main():
+    import gc
+    import tracemalloc
+    import datetime
+    from core.file_based import FileBased
+
+    # Simulate loading a large library, comparing full MusicDb objects to TrackRecords
+    num_tracks = 100000
+
+    def make_rows():
+        date = datetime.datetime(2020, 1, 1)
+        for i in range(num_tracks):
+            yield {'title': 'Song %d' % i,
+                   'artist': 'Artist %d' % (i // 100),
+                   'album': 'Album %d' % (i // 10),
+                   'albumartist': 'Artist %d' % (i // 100),
+                   'genre': 'Genre %d' % (i % 20),
+                   'year': 2000 + i % 20,
+                   'tn': i % 10 + 1,
+                   'tc': 10,
+                   'length': 200000 + i,
+                   'bitrate': 256000,
+                   'fsize': 6000000 + i,
+                   'play_count': i % 7,
+                   'date_added': date,
+                   'location': '/music/Artist %d/Album %d/%02d Song %d.mp3' %
+                               (i // 100, i // 10, i % 10 + 1, i)}
+
+    class DictDb(FileBased):
+        all_keys = MusicDb.all_keys
+
+    for name, load in (('MusicDb', lambda: [DictDb(row) for row in make_rows()]),
+                       ('TrackRecord', lambda: [TrackRecord.from_metadata(DictDb(row))
+                                                for row in make_rows()])):
+        gc.collect()
+        tracemalloc.start()
+        tracks = load()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('%s: %d tracks, %.1fMB (%.0f bytes/track), peak %.1fMB' %
+              (name, len(tracks), current / 1e6, current / len(tracks), peak / 1e6))
+        del tracks
+
+    record = TrackRecord.from_metadata(DictDb(next(make_rows())))
+    print(record.format())
+
+if __name__ == '__main__':
+    main()
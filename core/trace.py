@@ -0,0 +1,247 @@
+"""Lightweight tracing of where time goes: named spans (timed sections of code) and counters.
+
+   Tracing is off unless start() is called (scripts do this with --trace, see
+   add_trace_argument); while it is off, span() returns a shared object that does nothing and
+   count() returns immediately, so instrumented code costs one global lookup (code that has to
+   do extra work to get the values it records checks enabled() first). The trace is
+   written in the Chrome trace event format (open it in chrome://tracing or Perfetto), and
+   summarized per span name."""
+
+import atexit
+import collections
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+_enabled = False
+# Time tracing started, which trace timestamps are relative to
+_start = 0.0
+# Finished spans: (name, process id, thread id, start, duration, args)
+_spans = list()
+_counters = collections.Counter()
+# Counter events: (name, process id, time, change, total in the process after the change)
+_counter_events = list()
+_lock = threading.Lock()
+
+class _NullSpan(object):
+    """Span used when tracing is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add_bytes(self, n):
+        pass
+
+    def set(self, **args):
+        pass
+
+_null_span = _NullSpan()
+
+class Span(object):
+    """A timed section of code, used as a context manager. Extra information (such as the
+       number of bytes processed) can be attached to it in its args."""
+
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        if exc_info[0] is not None:
+            self.args['error'] = exc_info[0].__name__
+        _spans.append((self.name, os.getpid(), threading.get_ident(), self.start,
+                       end - self.start, self.args))
+        return False
+
+    def add_bytes(self, n):
+        self.args['bytes'] = self.args.get('bytes', 0) + n
+
+    def set(self, **args):
+        self.args.update(args)
+
+def enabled():
+    return _enabled
+
+def span(name, **args):
+    """Returns a context manager timing the code in its block under name, with args recorded
+       alongside it."""
+    if not _enabled:
+        return _null_span
+    return Span(name, args)
+
+def traced(name):
+    """Decorator recording each call of a function as a span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(name, dict()):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name, n=1):
+    """Adds n to the counter name."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] += n
+        _counter_events.append((name, os.getpid(), time.perf_counter(), n, _counters[name]))
+
+def start():
+    """Starts recording spans and counters, discarding any recorded earlier."""
+    global _enabled, _start
+    del _spans[:]
+    del _counter_events[:]
+    _counters.clear()
+    _start = time.perf_counter()
+    _enabled = True
+
+def stop():
+    global _enabled
+    _enabled = False
+
+def chrome_trace():
+    """Returns the recorded trace as a dict in the Chrome trace event format."""
+    events = list()
+    for name, pid, tid, start, duration, args in _spans:
+        events.append({'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                       'ts': (start - _start) * 1e6, 'dur': duration * 1e6,
+                       'args': _json_safe(args)})
+    for name, pid, t, n, total in _counter_events:
+        events.append({'name': name, 'ph': 'C', 'pid': pid, 'ts': (t - _start) * 1e6,
+                       'args': {name: total}})
+    events.sort(key=lambda e: e['ts'])
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+def write(fname):
+    with open(fname, 'w') as fobj:
+        json.dump(chrome_trace(), fobj)
+
+def summary():
+    """Returns a table of the number of calls, total and longest time and bytes of each span
+       name, and the totals of the counters."""
+    calls = collections.Counter()
+    totals = collections.defaultdict(float)
+    longest = collections.defaultdict(float)
+    sizes = collections.Counter()
+    for name, pid, tid, start, duration, args in _spans:
+        calls[name] += 1
+        totals[name] += duration
+        longest[name] = max(longest[name], duration)
+        sizes[name] += args.get('bytes', 0)
+
+    lines = ['%-24s %8s %10s %10s %10s %12s' % ('span', 'calls', 'total ms', 'mean ms',
+                                                 'max ms', 'bytes')]
+    for name in sorted(totals, key=totals.get, reverse=True):
+        lines.append('%-24s %8d %10.1f %10.3f %10.3f %12s' %
+                     (name, calls[name], totals[name] * 1e3, totals[name] * 1e3 / calls[name],
+                      longest[name] * 1e3, sizes[name] or ''))
+    if _counters:
+        lines.append('')
+        lines.append('%-24s %8s' % ('counter', 'total'))
+        for name, total in sorted(_counters.items()):
+            lines.append('%-24s %8d' % (name, total))
+    return '\n'.join(lines)
+
+class remote(object):
+    """Wraps a module-level function to be run in worker processes (e.g. by a
+       ProcessPoolExecutor), so that the spans and counters it records are sent back with its
+       results. Pass each result through merge() in the tracing process."""
+
+    def __init__(self, func):
+        self.func = func
+        self.enabled = _enabled
+        self.start = _start
+
+    def __call__(self, *args, **kwargs):
+        global _enabled, _start
+        if not self.enabled:
+            return self.func(*args, **kwargs), None, None
+        _enabled, _start = True, self.start
+        n_spans, n_counters = len(_spans), len(_counter_events)
+        try:
+            result = self.func(*args, **kwargs)
+            return result, _spans[n_spans:], _counter_events[n_counters:]
+        finally:
+            # They have been sent back, so the worker doesn't need to keep them
+            del _spans[n_spans:]
+            del _counter_events[n_counters:]
+
+def merge(remote_result):
+    """Records the spans and counters of a result returned by a remote function, and returns
+       the function's actual result."""
+    result, spans, counter_events = remote_result
+    if spans is not None and _enabled:
+        _spans.extend(spans)
+        with _lock:
+            for name, pid, t, n, total in counter_events:
+                _counters[name] += n
+            _counter_events.extend(counter_events)
+    return result
+
+def add_trace_argument(parser):
+    """Adds the --trace option to an argparse parser."""
+    parser.add_argument('--trace', metavar='OUT.json',
+                        help='Record where time is spent, writing a Chrome trace to OUT.json '
+                             'and a summary to stderr')
+
+def trace_from_args(args):
+    """Starts tracing if --trace was given, writing out the trace when the script exits."""
+    fname = getattr(args, 'trace', None)
+    if fname is None:
+        return
+    start()
+
+    def finish():
+        stop()
+        write(fname)
+        print(summary(), file=sys.stderr)
+        print('Trace written to %s' % fname, file=sys.stderr)
+    atexit.register(finish)
+
+def _json_safe(args):
+    return dict([(k, v if isinstance(v, (int, float, bool, type(None))) else str(v))
+                 for k, v in args.items()])
+
+def main():
+    # Compare the cost of instrumented code with tracing off and on
+    n = 200000
+
+    def run():
+        begin = time.perf_counter()
+        for i in range(n):
+            with span('work'):
+                count('items')
+        return (time.perf_counter() - begin) / n
+
+    def baseline():
+        begin = time.perf_counter()
+        for i in range(n):
+            pass
+        return (time.perf_counter() - begin) / n
+
+    base = baseline()
+    off = run()
+    start()
+    on = run()
+    stop()
+    print('Per span: %.3fus with tracing off, %.3fus with tracing on (loop %.3fus)' %
+          ((off - base) * 1e6, (on - base) * 1e6, base * 1e6))
+    print(summary())
+
+if __name__ == '__main__':
+    main()
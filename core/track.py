@@ -3,7 +3,7 @@ import pprint
 import os.path
 
 from mfile import open_music_file, mapping as mfile_mapping
-from db import open_db, db_from_metadata
+from db import open_db, open_dbs, db_from_metadata
 from db.db import MusicDb
 from core.fd import FormattingDictLike
 import config
@@ -28,10 +28,20 @@ class Track(FormattingDictLike):
         else:
             self._metadata_ordering = (self.mfile, self.db, self.other)
 
-        self.all_keys = list()
+        all_keys = list()
         for metadata in self._metadata_ordering:
             if metadata:
-                self.all_keys.extend([k for k in metadata.all_keys if k not in self.all_keys])
+                all_keys.extend([k for k in metadata.all_keys if k not in all_keys])
+                # Drop cached values when the metadata is changed
+                if hasattr(metadata, 'add_listener'):
+                    metadata.add_listener(self._invalidate)
+        self.all_keys = tuple(all_keys)
+        self._key_set = frozenset(all_keys)
+        # Values of keys already looked up in the underlying metadata
+        self._resolved = dict()
+
+    def _invalidate(self):
+        self._resolved.clear()
 
     @property
     def default_metadata(self):
@@ -39,10 +49,13 @@ class Track(FormattingDictLike):
         return m1 or m2 or m3
 
     def __getattr__(self, key):
-        if key in ('_metadata_ordering', 'all_keys'):
+        if key in ('_metadata_ordering', 'all_keys', '_key_set', '_resolved'):
             return super(Track).__getattr__(key)
         mo = self._metadata_ordering
-        if key in self.all_keys:
+        if key in self._key_set:
+            resolved = self._resolved
+            if key in resolved:
+                return resolved[key]
             value = None
             for metadata in mo:
                 if metadata is not None:
@@ -52,6 +65,7 @@ class Track(FormattingDictLike):
                             break
                     except AttributeError:
                         pass
+            resolved[key] = value
             return value
         else:
             for metadata in mo:
@@ -94,6 +108,12 @@ class Track(FormattingDictLike):
     def from_file(cls, fname, **kwargs):
         return cls(open_music_file(fname), open_db(fname), **kwargs)
 
+    @classmethod
+    def from_files(cls, fnames, **kwargs):
+        """Returns a Track for each of fnames, looking all of them up in the database at once."""
+        dbs = open_dbs(fnames)
+        return [cls(open_music_file(fname), dbs.get(fname, None), **kwargs) for fname in fnames]
+
     @classmethod
     def from_metadata(cls, metadata, match_to_existing=True, **kwargs):
         if match_to_existing and getattr(metadata, 'location', None):
@@ -115,8 +135,17 @@ class Track(FormattingDictLike):
             mfile_saved = self.mfile.save()
         if self.db:
             db_saved = self.db.save()
+        # Saving can change values that weren't set, e.g. the file size and bitrate
+        self._invalidate()
         return mfile_saved, db_saved
 
+    def refresh(self):
+        """Rereads the music file, e.g. after it has been rewritten by another program, and drops
+           any values looked up before."""
+        if self.mfile:
+            self.mfile.refresh()
+        self._invalidate()
+
     def commit(self):
         if self.db:
             self.db.commit()
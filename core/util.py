@@ -20,6 +20,9 @@ PATHNAME_CHARS = "~!@$&*()-_=+:',."
 
 initial_period_re = re.compile(r"^(\.+)")
 tuple_re = re.compile(r"^\(([^\)]+)\)$")
+# Matches the characters is_forbidden_char is true for
+forbidden_fname_re = re.compile('[%s\u9000-\U0010ffff]' %
+                                re.escape(''.join(sorted(forbidden_fname_chars))))
 
 ts_fmt = '%Y-%m-%d %H:%M:%S'
 
@@ -73,7 +76,7 @@ def make_numcount_descriptors(numname, countname, fieldname, alttotal=''):
 
     def get_count(self):
         try:
-            count = self.get_item(alttotal)
+            count = self.get_item(alttotal) if alttotal else None
             if count is None:
                 count = self.get_item(fieldname).split('/')[1]
             return int(count)
@@ -94,7 +97,7 @@ def make_numcount_descriptors(numname, countname, fieldname, alttotal=''):
 
     def get_numcount(self):
         try:
-            count = self.get_item(alttotal)
+            count = self.get_item(alttotal) if alttotal else None
             if count is not None:
                 try:
                     return int(self.get_item(fieldname)), int(count)
@@ -168,9 +171,7 @@ def is_forbidden_char(c):
 def filter_fname(f):
     """ "Sanitizes" a filename: replaces forbidden characters and ending periods in directory names"""
 
-    forbidden_chars = [c for c in f if is_forbidden_char(c)]
-    for c in forbidden_chars: # Replace characters in filename
-        f = f.replace(c, '_')
+    f = forbidden_fname_re.sub('_', f) # Replace characters in filename
     dir_name, fname = os.path.split(f)
 
     if dir_name != '' and dir_name[-1] == '.': # Period at end of directory name?
@@ -190,16 +191,24 @@ def filter_path_elements(elements):
        elements is the list of path elementst hat may contain slashes; artist, album, title, etc."""
     # Remove forward slashes and leading periods in the path elements
     for i, element in enumerate(elements):
-        element = element.replace('/', '_')
-        # Do not let a name start with a period (to avoid appearing hidden)
-        if element.startswith('.'):
-            element = '_%s' % element[1:]
-        # Do not let a name end with a space or period (Windows restriction)
-        if element.endswith('.'):
-            element = '%s_' % element[:-1]
-        elements[i] = element
+        elements[i] = _filter_path_element(element)
     return filter_fname(os.path.join(*elements))
 
+def filter_path_element(element):
+    """Sanitizes a single path element (with no base directory) the same way
+       filter_path_elements does, without splitting and rejoining the path."""
+    return forbidden_fname_re.sub('_', _filter_path_element(element))
+
+def _filter_path_element(element):
+    element = element.replace('/', '_')
+    # Do not let a name start with a period (to avoid appearing hidden)
+    if element.startswith('.'):
+        element = '_%s' % element[1:]
+    # Do not let a name end with a space or period (Windows restriction)
+    if element.endswith('.'):
+        element = '%s_' % element[:-1]
+    return element
+
 def excape_xml_chars(s):
     s = s.replace('&', "&amp;")
     s = s.replace('<', "&lt;")
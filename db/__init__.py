@@ -4,5 +4,8 @@ import config
 def open_db(fname):
     return config.DefaultDb().from_file(fname)
 
+def open_dbs(fnames):
+    return config.DefaultDb().from_files(fnames)
+
 def db_from_metadata(metadata):
     return config.DefaultDb().from_metadata(metadata)
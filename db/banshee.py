@@ -1,9 +1,15 @@
+import collections
+
 import config
 from db.db import MusicDb
 from core import db_glue
 from core.util import date_descriptor, make_descriptor_func, sql2pathname, pathname2sql
 
-db = db_glue.new(config.BansheeDbLoc)
+# Connected to on first use, read-only until a track is saved
+db = db_glue.LazyDB(config.BansheeDbLoc,
+                    {'mmap_size': config.BansheeMmapSize,
+                     'cache_size': -config.BansheeCacheSize,
+                     'temp_store': 'MEMORY'})
 
 # Statement template used to pull everything useful from the sqlite database
 select_stmt = """SELECT ct.TrackID AS TrackID, ct.Title AS title, ct.TitleSort AS title_sort,
@@ -54,68 +60,109 @@ class BansheeDb(MusicDb):
     # Overridden from MusicDb
 
     def _save(self, changes):
-        changes_sql = list()
-        for name, v in sorted(changes.items()):
-            if name in field_mapping:
-                trans_name = field_mapping[name]
-                if v is None:
-                    changes_sql.append('%s = NULL' % trans_name)
-                else:
-                    changes_sql.append('%s = :%s' % (trans_name, name))
+        columns = [name for name in changes if name in field_mapping]
+        if not columns:
+            return
+        if self._batch is not None:
+            self._batch.add(self.id_, self, columns)
+        else:
+            self._write_updates({tuple(sorted(columns)): [self]})
 
-        if changes_sql:
-            db.sql(update_stmt % ', '.join(changes_sql), **self.to_dict())
+    def _update_params(self, columns):
+        # The values as stored in the database
+        params = dict([(name, self.wrapped.get(name, None)) for name in columns])
+        params['TrackID'] = self.id_
+        return params
+
+    @classmethod
+    def _write_updates(cls, groups):
+        """Takes a mapping from tuples of changed columns to the tracks with those changes, and
+           writes them with one statement per tuple of columns."""
+        writer = db.writable()
+        for columns, tracks in sorted(groups.items()):
+            sql = update_stmt % ', '.join(['%s = :%s' % (field_mapping[name], name)
+                                           for name in columns])
+            writer.sql_many(sql, [track._update_params(columns) for track in tracks])
+
+    @classmethod
+    def _flush_batch(cls, batch):
+        groups = collections.defaultdict(list)
+        for track, columns in batch.changes.values():
+            groups[tuple(sorted(columns))].append(track)
+        cls._write_updates(groups)
 
     @classmethod
     def commit(cls):
+        if cls._batch is not None:
+            cls._batch.commit_requested = True
+            return
         db.commit()
 
     @classmethod
     def load_all(cls):
-        return [cls(row) for row in db.sql(select_stmt % {'where': ''})]
+        return [cls(dict(row)) for row in db.iter_sql(select_stmt % {'where': ''})]
 
     @classmethod
-    def _load_playlists(cls):
-        playlists = list()
+    def load_records(cls):
+        from core.record import TrackRecord
+        # Only keep one BansheeDb (and one batch of rows) alive at a time
+        return [TrackRecord.from_metadata(cls(dict(row)))
+                for row in db.iter_sql(select_stmt % {'where': ''})]
 
+    @classmethod
+    def _load_playlists(cls, names=None):
         #Get the listings of playlists
         playlists = db.sql("SELECT Name, PlaylistID FROM CorePlaylists")
         smart_playlists = db.sql("SELECT Name, SmartPlaylistID AS PlaylistID "
                       "FROM CoreSmartPlaylists")
 
+        if names is not None:
+            playlists = [row for row in playlists if row['Name'] in names]
+            smart_playlists = [row for row in smart_playlists if row['Name'] in names]
+
         return playlists, smart_playlists
 
     @classmethod
-    def load_playlists(cls):
-        playlists, smart_playlists = cls._load_playlists()
-        all_tracks = cls.load_all()
-        track_ids_to_tracks = dict([(track.id_, track) for track in all_tracks])
-        smart_playlist_entries = db.sql('SELECT EntryID, SmartPlaylistID AS '
-                                'PlaylistID, TrackID FROM CoreSmartPlaylistEntries '
-                                'ORDER BY EntryID')
+    def load_playlists(cls, names=None):
+        """Returns: {playlist_name (string):
+                     [BansheeDb()]}
+           for all playlists, or only those in names. The entries of all of the playlists are
+           fetched in one query (and those of the smart playlists in another), and only the
+           tracks in them are loaded."""
+        playlists, smart_playlists = cls._load_playlists(names)
+
+        def id_list(pl_rows):
+            # Playlist IDs come from the database, so they can be put in the SQL directly
+            return ', '.join([str(int(row['PlaylistID'])) for row in pl_rows])
+
+        # (playlists, SQL selecting their entries, order of the entries)
+        entry_queries = list()
+        if playlists:
+            entry_queries.append((playlists, 'SELECT PlaylistID, TrackID FROM CorePlaylistEntries '
+                                  'WHERE PlaylistID IN (%s)' % id_list(playlists),
+                                  'ViewOrder, EntryID'))
+        if smart_playlists:
+            entry_queries.append((smart_playlists, 'SELECT SmartPlaylistID AS PlaylistID, TrackID '
+                                  'FROM CoreSmartPlaylistEntries '
+                                  'WHERE SmartPlaylistID IN (%s)' % id_list(smart_playlists),
+                                  'EntryID'))
+
+        # Load only the tracks in the playlists
+        track_ids_to_tracks = dict()
+        if entry_queries:
+            where = ' WHERE ct.TrackID IN (%s)' % ' UNION '.join(
+                ['SELECT TrackID FROM (%s)' % sql for pl_rows, sql, order in entry_queries])
+            for row in db.sql(select_stmt % {'where': where}):
+                track = cls(row)
+                track_ids_to_tracks[track.id_] = track
 
         all_playlists = dict()
-        for pl_row in playlists:
-            name = pl_row['Name']
-            pl_id = pl_row['PlaylistID']
-            pl_list = list()
-            playlist_entries = db.sql('SELECT EntryID, TrackID FROM '
-                        'CorePlaylistEntries WHERE PlaylistID = ? '
-                        'ORDER BY ViewOrder, EntryID', pl_id)
-            for row in playlist_entries:
-                pl_list.append(track_ids_to_tracks[row['TrackID']])
-            all_playlists[name] = pl_list
-
-        for pl_row in smart_playlists:
-            name = pl_row['Name']
-            pl_id = pl_row['PlaylistID']
-            pl_list = list()
-            playlist_entries = db.sql('SELECT EntryID, TrackID FROM '
-                        'CoreSmartPlaylistEntries WHERE SmartPlaylistID = ? '
-                        'ORDER BY EntryID', pl_id)
-            for row in playlist_entries:
-                pl_list.append(track_ids_to_tracks[row['TrackID']])
-            all_playlists[name] = pl_list
+        for pl_rows, sql, order in entry_queries:
+            entries = collections.defaultdict(list)
+            for row in db.sql('%s ORDER BY PlaylistID, %s' % (sql, order)):
+                entries[row['PlaylistID']].append(track_ids_to_tracks[row['TrackID']])
+            for pl_row in pl_rows:
+                all_playlists[pl_row['Name']] = entries[pl_row['PlaylistID']]
 
         return all_playlists
 
@@ -126,6 +173,31 @@ class BansheeDb(MusicDb):
         except ValueError:
             return None
 
+    @classmethod
+    def from_files(cls, locs):
+        # Join the tracks against a temporary table of the URIs to look up, instead of running
+        # the select once per file
+        uris_to_locs = dict([(pathname2sql(loc), loc) for loc in locs])
+        # Filling the table starts a transaction, which would keep Banshee's database locked
+        in_transaction = db.conn.in_transaction
+        db.sql("CREATE TEMP TABLE IF NOT EXISTS LookupUris (Uri TEXT PRIMARY KEY)")
+        db.sql("DELETE FROM temp.LookupUris")
+        db.sql_many("INSERT INTO temp.LookupUris (Uri) VALUES (?)",
+                    [(uri,) for uri in uris_to_locs.keys()])
+        rows = db.sql(select_stmt %
+                      {'where': " WHERE ct.Uri IN (SELECT Uri FROM temp.LookupUris)"})
+        db.sql("DELETE FROM temp.LookupUris")
+        if not in_transaction:
+            # Only the temporary table has been changed
+            db.commit()
+
+        uri_rows = collections.defaultdict(list)
+        for row in rows:
+            uri_rows[row['Uri']].append(row)
+        # Like from_file, leave out files matching several tracks
+        return dict([(uris_to_locs[uri], cls(rows[0])) for uri, rows in uri_rows.items()
+                     if len(rows) == 1])
+
     @classmethod
     def from_metadata(cls, md):
         rows = list()
@@ -1,7 +1,26 @@
 import abc
+import contextlib
 
 from core.file_based import FileBased
 
+class WriteBatch(object):
+    """Changes saved by MusicDb objects while a batch is in effect (see MusicDb.batch): for
+       each object saved, keyed by its identity in the database, the object and the set of keys
+       changed in it."""
+
+    def __init__(self):
+        self.changes = dict()
+        self.commit_requested = False
+
+    def add(self, key, obj, changed_keys):
+        if key in self.changes:
+            self.changes[key][1].update(changed_keys)
+        else:
+            self.changes[key] = (obj, set(changed_keys))
+
+    def __len__(self):
+        return len(self.changes)
+
 class MusicDb(FileBased):
     """Base class for metadata derived from a database/data file, e.g. one generated by a music player."""
 
@@ -25,9 +44,38 @@ class MusicDb(FileBased):
 
     read_only_keys = ()
 
+    # The WriteBatch collecting saves of objects of this class, while batch() is in effect
+    _batch = None
+
     def __init__(self, d):
         super(MusicDb, self).__init__(d)
 
+    @classmethod
+    @contextlib.contextmanager
+    def batch(cls):
+        """Context manager holding back the database writes of objects of this class that are
+           saved, and calls to commit(), until it exits. The saved changes are then written all
+           at once (see _flush_batch) and committed. Nothing is written if an exception is
+           raised. Nested batches are part of the outermost one."""
+        if cls._batch is not None:
+            yield cls._batch
+            return
+
+        batch = cls._batch = WriteBatch()
+        try:
+            yield batch
+        finally:
+            cls._batch = None
+        if batch:
+            cls._flush_batch(batch)
+        if batch or batch.commit_requested:
+            cls.commit()
+
+    @classmethod
+    def _flush_batch(cls, batch):
+        """Writes the changes collected in a WriteBatch to the database."""
+        pass
+
     # To be overridden
 
     @classmethod
@@ -43,12 +91,19 @@ class MusicDb(FileBased):
         """Returns a list of all instances of this object in the corresponding database."""
         raise NotImplementedError
 
+    @classmethod
+    def load_records(cls):
+        """Returns a list of read-only TrackRecords for all tracks in the corresponding database.
+           These take much less memory than the objects returned by load_all."""
+        from core.record import TrackRecord
+        return [TrackRecord.from_metadata(track) for track in cls.load_all()]
+
     @classmethod
     @abc.abstractmethod
-    def load_playlists(cls):
-        """For all playlists, loads and returns a mapping from playlist name to a list
-           of MusicDb instances corresponding to the tracks in that playlist. NOTE: Multiple
-           playlists can contain references to the same object."""
+    def load_playlists(cls, names=None):
+        """For all playlists (or only those named in names), loads and returns a mapping from
+           playlist name to a list of MusicDb instances corresponding to the tracks in that
+           playlist. NOTE: Multiple playlists can contain references to the same object."""
         raise NotImplementedError
 
     @classmethod
@@ -57,6 +112,17 @@ class MusicDb(FileBased):
         """Initializes and returns a new object of this class from a file, or None if not matched."""
         raise NotImplementedError
 
+    @classmethod
+    def from_files(cls, locs):
+        """Looks up many files at once. Returns a mapping from each of locs that was matched
+           to a new object of this class."""
+        dbs = dict()
+        for loc in locs:
+            db = cls.from_file(loc)
+            if db is not None:
+                dbs[loc] = db
+        return dbs
+
     @classmethod
     @abc.abstractmethod
     def from_metadata(cls, metadata):
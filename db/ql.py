@@ -1,3 +1,4 @@
+import logging
 import operator
 import os.path
 import os
@@ -8,6 +9,7 @@ sys.path.append(os.path.abspath(os.path.join(os.pardir, 'quodlibet', 'quodlibet'
 from quodlibet.formats import load_audio_files, dump_audio_files
 
 from .db import MusicDb
+from .ql_query import compile_query, search, QueryError
 import config
 from core.util import date_descriptor, int_descriptor, make_descriptor_func, make_numcount_descriptors
 
@@ -114,17 +116,27 @@ class QLDb(MusicDb):
 
     def _save(self, changes):
         # No need for any action, self.wrapped is already a song in qls._songs that will be saved
-        # when commit is called
-        pass
+        # when commit is called; in a batch, just note that there is something to save
+        if self._batch is not None and changes:
+            self._batch.add(self.wrapped['~filename'], self, changes)
 
     @classmethod
     def commit(cls):
+        # In a batch, the songs file is written once when the batch ends
+        if cls._batch is not None:
+            cls._batch.commit_requested = True
+            return
         qls.save_songs()
 
     @classmethod
     def load_all(cls):
         return [cls(song) for song in qls.songs]
 
+    @classmethod
+    def load_records(cls):
+        from core.record import TrackRecord
+        return [TrackRecord.from_metadata(cls(song)) for song in qls.songs]
+
     @classmethod
     def _ql_query(cls, query):
         try:
@@ -162,6 +174,7 @@ class QLDb(MusicDb):
             playlists[pl_file] = pl_list
 
         # Smart playlists
+        queries = dict()
         queries_file = os.path.join(lists_dir, 'queries.saved')
         if os.path.isfile(queries_file):
             with open(queries_file, 'r') as fobj:
@@ -169,14 +182,36 @@ class QLDb(MusicDb):
                 while query != '':
                     name = cur_line = fobj.readline().strip()
                     if names is None or name in names:
-                        pl_list = list()
-                        for line in cls._ql_query(query):
-                            pl_list.append(_from_file(line))
-                        playlists[name] = pl_list
+                        queries[name] = query
                     query = fobj.readline().strip()
 
+        for name, locs in cls._ql_queries(queries).items():
+            playlists[name] = [_from_file(loc) for loc in locs]
+
         return playlists
 
+    @classmethod
+    def _ql_queries(cls, queries):
+        """Takes a mapping from names to queries, and returns a mapping from each name to the
+           sorted locations of the songs matching its query. Queries are evaluated together
+           over the loaded songs where possible, and by Quod Libet otherwise."""
+        results = dict()
+        compiled = dict()
+        for name, query in queries.items():
+            if config.QLNativeQueries:
+                try:
+                    compile_query(query)
+                    compiled[name] = query
+                    continue
+                except QueryError as e:
+                    logging.debug('Asking Quod Libet for %s: %s', name, e)
+            results[name] = cls._ql_query(query)
+
+        if compiled:
+            for name, songs in search(compiled, qls.songs).items():
+                results[name] = sorted([song['~filename'] for song in songs])
+        return results
+
     @classmethod
     def from_file(cls, loc):
         try:
@@ -0,0 +1,327 @@
+"""Evaluates Quod Libet search queries (as used in saved smart playlists) over the songs of a
+   loaded songs file, instead of asking a quodlibet process for the results.
+
+   Supported syntax:
+       text                    text contained in the artist, album or title
+       tag = value             value contained in the tag; tag may be a list (artist, performer),
+                               or one of ~people, ~basename, ~dirname and ~filename
+       tag = "value"           exact match; add c after the quotes to match case
+       tag = /regex/           regular expression search; flags c (match case) and s (dotall)
+       #(tag < number)         numeric comparison (<, <=, >, >=, =, !=), also a < tag < b;
+                               numbers may have units (3:30, 2 weeks, 5 MB), and the ages of
+                               time tags (added, lastplayed, ...) are compared
+       !query, &(q1, q2, ...), |(q1, q2, ...)
+                               negation, and, or; also usable on values (tag = |(a, b))
+
+   Other tags starting with ~ (which Quod Libet computes) and anything else raise QueryError,
+   so the caller can fall back to Quod Libet itself."""
+
+import os.path
+import re
+import time
+
+# Tags searched by a query without a tag name
+STAR = ('artist', 'album', 'title')
+
+# Tags combined by ~people
+PEOPLE = ('albumartist', 'artist', 'author', 'composer', 'performer', 'originalartist',
+          'lyricist', 'arranger', 'conductor')
+
+# Tags starting with ~ that can be searched as text; Quod Libet synthesizes many more
+TEXT_INTERNAL_TAGS = frozenset(('~people', '~basename', '~dirname', '~filename'))
+
+# Numeric tags whose values are timestamps; comparisons are on how long ago they were
+TIME_TAGS = frozenset(('added', 'lastplayed', 'laststarted', 'mtime'))
+
+# Values of numeric tags that songs don't have
+NUMERIC_DEFAULTS = {'rating': 0.5}
+
+# Multipliers for units of numeric values; numbers with time units (or written as m:ss) are
+# time spans, which can only be compared to lengths and the ages of time tags
+TIME_UNITS = {'second': 1, 'sec': 1, 'minute': 60, 'min': 60, 'hour': 3600, 'day': 86400,
+              'week': 7 * 86400, 'month': 30 * 86400, 'year': 365 * 86400}
+SIZE_UNITS = {'b': 1, 'kb': 1024, 'mb': 1024 ** 2, 'gb': 1024 ** 3}
+
+COMPARISONS = {'<': lambda a, b: a < b, '<=': lambda a, b: a <= b,
+               '>': lambda a, b: a > b, '>=': lambda a, b: a >= b,
+               '=': lambda a, b: a == b, '==': lambda a, b: a == b,
+               '!=': lambda a, b: a != b}
+
+# Operators that reverse direction when the operands are swapped
+REVERSED = {'<': '>', '<=': '>=', '>': '<', '>=': '<=', '=': '=', '==': '==', '!=': '!='}
+
+tag_re = re.compile(r'\s*([~#\w-]+(?:\s*,\s*[~#\w-]+)*)\s*=(?!=)')
+op_re = re.compile(r'\s*(<=|>=|==|!=|<|>|=)\s*')
+number_re = re.compile(r'\s*(\d+(?::\d+)*(?:\.\d+)?)\s*([a-zA-Z]*)\s*')
+word_re = re.compile(r'\s*([~#\w-]+)\s*')
+
+class QueryError(ValueError):
+    pass
+
+def compile_query(query):
+    """Returns a function taking a song (a Quod Libet AudioFile or a dict) and returning whether
+       it matches query. Raises QueryError if the query can't be parsed."""
+    parser = _Parser(query)
+    match = parser.parse_query()
+    parser.skip_space()
+    if parser.pos != len(query):
+        parser.fail('Unexpected text')
+    return match
+
+def search(queries, songs):
+    """Evaluates several queries over songs in a single pass. queries is a mapping from names to
+       queries; returns a mapping from each name to the list of songs matching its query, in the
+       order of songs."""
+    compiled = [(name, compile_query(query)) for name, query in queries.items()]
+    results = dict([(name, list()) for name in queries])
+    for song in songs:
+        for name, match in compiled:
+            if match(song):
+                results[name].append(song)
+    return results
+
+def _tag_value(song, tag):
+    if tag == '~people':
+        return '\n'.join([song[t] for t in PEOPLE if song.get(t, None)])
+    elif tag == '~basename':
+        return os.path.basename(song.get('~filename', ''))
+    elif tag == '~dirname':
+        return os.path.dirname(song.get('~filename', ''))
+    return song.get(tag, '')
+
+def _numeric_value(song, tag):
+    if tag in ('date', 'year'):
+        m = re.match(r'\d+', song.get('date', ''))
+        return int(m.group()) if m else 0
+    elif tag in ('track', 'disc'):
+        value = song.get(tag + 'number', '').split('/')[0]
+        return int(value) if value.isdigit() else 0
+    value = song.get('~#' + tag, NUMERIC_DEFAULTS.get(tag, 0))
+    if tag in TIME_TAGS:
+        return time.time() - value
+    return value
+
+class _Parser(object):
+
+    def __init__(self, query):
+        self.query = query
+        self.pos = 0
+
+    def fail(self, message):
+        raise QueryError('%s at position %d of %r' % (message, self.pos, self.query))
+
+    def skip_space(self):
+        while self.pos < len(self.query) and self.query[self.pos].isspace():
+            self.pos += 1
+
+    def peek(self):
+        self.skip_space()
+        return self.query[self.pos:self.pos + 1]
+
+    def expect(self, c):
+        if self.peek() != c:
+            self.fail('Expected %r' % c)
+        self.pos += 1
+
+    def parse_list(self, parse_item):
+        # "(" item ("," item)* ")"; the opening character has already been consumed
+        self.expect('(')
+        items = [parse_item()]
+        while self.peek() == ',':
+            self.pos += 1
+            items.append(parse_item())
+        self.expect(')')
+        return items
+
+    def parse_query(self):
+        c = self.peek()
+        if c == '':
+            self.fail('Empty query')
+        elif c == '!':
+            self.pos += 1
+            match = self.parse_query()
+            return lambda song: not match(song)
+        elif c in '&|' and self.query[self.pos + 1:].lstrip().startswith('('):
+            self.pos += 1
+            matches = self.parse_list(self.parse_query)
+            return _combine(c, matches)
+        elif c == '#' and self.query[self.pos + 1:].lstrip().startswith('('):
+            self.pos += 1
+            self.expect('(')
+            match = self.parse_numeric()
+            self.expect(')')
+            return match
+
+        m = tag_re.match(self.query, self.pos)
+        if m:
+            self.pos = m.end()
+            tags = [t.strip().lower() for t in m.group(1).split(',')]
+            for tag in tags:
+                if tag.startswith('~#'):
+                    self.fail('Cannot search the numeric tag %s as text' % tag)
+                elif tag.startswith('~') and tag not in TEXT_INTERNAL_TAGS:
+                    self.fail('Unsupported tag %s' % tag)
+            value_match = self.parse_value()
+        else:
+            tags = STAR
+            start = self.pos
+            value_match = self.parse_value()
+            if len(self.query[start:self.pos].split()) > 1:
+                # Quod Libet matches each word separately here
+                self.fail('Unsupported search for several words')
+        if len(tags) == 1:
+            tag = tags[0]
+            return lambda song: value_match(_tag_value(song, tag))
+        return lambda song: any([value_match(_tag_value(song, tag)) for tag in tags])
+
+    def parse_value(self):
+        """Returns a function taking a tag value (string) and returning whether it matches."""
+        c = self.peek()
+        if c == '!':
+            self.pos += 1
+            match = self.parse_value()
+            return lambda value: not match(value)
+        elif c in '&|' and self.query[self.pos + 1:].lstrip().startswith('('):
+            self.pos += 1
+            return _combine(c, self.parse_list(self.parse_value))
+        elif c == '/':
+            pattern = self.parse_delimited('/')
+            flags = self.parse_flags()
+            re_flags = 0 if 'c' in flags else re.IGNORECASE
+            if 's' in flags:
+                re_flags |= re.DOTALL
+            try:
+                regex = re.compile(pattern, re_flags | re.MULTILINE)
+            except re.error as e:
+                self.fail('Invalid regular expression (%s)' % e)
+            return lambda value: regex.search(value) is not None
+        elif c == '"':
+            text = self.parse_delimited('"')
+            flags = self.parse_flags()
+            # Exact match of any of the tag's values
+            regex = re.compile('^%s$' % re.escape(text),
+                               re.MULTILINE | (0 if 'c' in flags else re.IGNORECASE))
+            return lambda value: regex.search(value) is not None
+
+        start = self.pos
+        while self.pos < len(self.query) and self.query[self.pos] not in ',)':
+            if self.query[self.pos] in '&|!#/"=()':
+                self.fail('Unsupported character %r' % self.query[self.pos])
+            self.pos += 1
+        text = self.query[start:self.pos].strip().lower()
+        if not text:
+            self.fail('Expected a value')
+        return lambda value: text in value.lower()
+
+    def parse_delimited(self, delimiter):
+        # Text between two delimiters, with backslash escapes of the delimiter
+        self.expect(delimiter)
+        chars = list()
+        while self.pos < len(self.query):
+            c = self.query[self.pos]
+            if c == '\\' and self.query[self.pos + 1:self.pos + 2] == delimiter:
+                chars.append(delimiter)
+                self.pos += 2
+            elif c == delimiter:
+                self.pos += 1
+                return ''.join(chars)
+            else:
+                # Keep other escapes for regular expressions
+                chars.append(c)
+                self.pos += 1
+        self.fail('Unterminated %s' % delimiter)
+
+    def parse_flags(self):
+        start = self.pos
+        while self.pos < len(self.query) and self.query[self.pos] in 'cisd':
+            self.pos += 1
+        return self.query[start:self.pos]
+
+    def parse_numeric(self):
+        """Parses the inside of #(...): tag op value, value op tag, or value op tag op value."""
+        operands = [self.parse_operand()]
+        ops = list()
+        while self.pos < len(self.query) and self.peek() != ')':
+            m = op_re.match(self.query, self.pos)
+            if not m:
+                self.fail('Expected a comparison')
+            self.pos = m.end()
+            ops.append(m.group(1))
+            operands.append(self.parse_operand())
+        tag_positions = [i for i, (kind, _) in enumerate(operands) if kind == 'tag']
+        if len(ops) not in (1, 2) or len(tag_positions) != 1 or \
+           len(ops) == 2 and tag_positions != [1]:
+            self.fail('Unsupported numeric comparison')
+        tag_index = tag_positions[0]
+        tag = operands[tag_index][1]
+
+        # Normalize each comparison to (tag op value)
+        comparisons = list()
+        for i, op in enumerate(ops):
+            if i == tag_index:
+                kind, value = operands[i + 1]
+            else:
+                kind, value = operands[i]
+                op = REVERSED[op]
+            if (kind == 'span') != (tag in TIME_TAGS) and not (kind == 'span' and tag == 'length'):
+                self.fail('Cannot compare %s to %s' % (tag, 'a time span' if kind == 'span'
+                                                       else 'a number'))
+            comparisons.append((COMPARISONS[op], value))
+
+        return lambda song: all([compare(_numeric_value(song, tag), value)
+                                 for compare, value in comparisons])
+
+    def parse_operand(self):
+        # Returns ('number', n), ('span', seconds) or ('tag', name)
+        m = number_re.match(self.query, self.pos)
+        if m:
+            self.pos = m.end()
+            number, unit = m.group(1), m.group(2).lower()
+            if ':' in number:
+                if unit:
+                    self.fail('Unexpected unit %r' % unit)
+                value = 0
+                for part in number.split(':'):
+                    value = value * 60 + float(part)
+                return ('span', value)
+            value = float(number)
+            if not unit:
+                return ('number', value)
+            if unit.endswith('s') and unit[:-1] in TIME_UNITS:
+                unit = unit[:-1]
+            if unit in SIZE_UNITS:
+                return ('number', value * SIZE_UNITS[unit])
+            elif unit not in TIME_UNITS:
+                self.fail('Unknown unit %r' % unit)
+            word = word_re.match(self.query, self.pos)
+            if word and word.group(1).lower() == 'ago':
+                self.pos = word.end()
+            return ('span', value * TIME_UNITS[unit])
+        m = word_re.match(self.query, self.pos)
+        if m and not m.group(1)[0].isdigit():
+            self.pos = m.end()
+            tag = m.group(1).lower()
+            if tag.startswith('~#'):
+                tag = tag[2:]
+            if '~' in tag:
+                self.fail('Unsupported tag %s' % m.group(1))
+            return ('tag', tag)
+        self.fail('Expected a tag or number')
+
+def _combine(op, matches):
+    if op == '&':
+        return lambda x: all([match(x) for match in matches])
+    return lambda x: any([match(x) for match in matches])
+
+def main():
+    import sys
+    from db.ql import qls
+
+    queries = dict([(q, q) for q in sys.argv[1:]])
+    for query, songs in search(queries, qls.songs).items():
+        print('%s: %d songs' % (query, len(songs)))
+        for song in songs:
+            print('\t%s' % song['~filename'])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+import array
+import collections
+import itertools
+
+import config
+from core.util import sort_key_defaults
+
+# Stored in integer columns in place of None
+_NONE = -2 ** 63
+
+class _IntColumn(object):
+    """Column of integers (or None), stored as a flat array of 64-bit ints."""
+
+    def __init__(self, values):
+        self.data = array.array('q', [_NONE if v is None else v for v in values])
+
+    def distinct(self):
+        """Returns a mapping from the code of each distinct value to the value."""
+        return dict([(c, None if c == _NONE else c) for c in set(self.data)])
+
+    def code(self, value):
+        return _NONE if value is None else value
+
+    def decode(self, codes):
+        return [None if c == _NONE else c for c in codes]
+
+    def sort_ranks(self, default):
+        """Returns a mapping from codes to sort ranks, for the codes whose rank isn't the code
+           itself, so that values sort as (value or default) does."""
+        return {_NONE: default, 0: default}
+
+class _CategoricalColumn(object):
+    """Column of arbitrary sortable values, stored as indices into a sorted list of the distinct
+       values (the categories). -1 means None."""
+
+    def __init__(self, values):
+        self.categories = sorted(set(values) - {None})
+        self.codes = dict([(v, i) for i, v in enumerate(self.categories)])
+        self.codes[None] = -1
+        self.data = array.array('l', map(self.codes.__getitem__, values))
+
+    def distinct(self):
+        distinct = dict(enumerate(self.categories))
+        distinct[-1] = None
+        return distinct
+
+    def code(self, value):
+        # Values not in the table match nothing
+        return self.codes.get(value, None)
+
+    def decode(self, codes):
+        categories = self.categories
+        return [None if c == -1 else categories[c] for c in codes]
+
+    def sort_ranks(self, default):
+        # Codes are already in the order of the values, except that falsy values sort with
+        # the default
+        effective = dict(enumerate([v or default for v in self.categories]))
+        effective[-1] = default
+        ranks = dict([(v, i) for i, v in enumerate(sorted(set(effective.values())))])
+        return dict([(c, ranks[v]) for c, v in effective.items()])
+
+class LibraryTable(object):
+    """Column-oriented table of the tracks in a library, for filtering, sorting and grouping a
+       whole library at once without going through each track's metadata object.
+
+       Integer fields are stored in arrays, and other fields (strings, dates) as codes into a
+       sorted list of their distinct values, so that comparisons are done once per distinct
+       value instead of once per track. filter() and sort() return new tables sharing the same
+       columns; rows() and tracks() give back the objects the table was built from."""
+
+    def __init__(self, objects, keys=None, _columns=None, _index=None):
+        self._objects = objects
+        if _columns is None:
+            if keys is None:
+                from core.record import record_keys
+                keys = record_keys
+            _columns = dict()
+            for key in keys:
+                values = [getattr(o, key, None) for o in objects]
+                if all([v is None or (isinstance(v, int) and not isinstance(v, bool))
+                        for v in values]):
+                    _columns[key] = _IntColumn(values)
+                else:
+                    _columns[key] = _CategoricalColumn(values)
+        self._columns = _columns
+        if _index is None:
+            _index = array.array('l', range(len(objects)))
+        # Positions in self._objects of the rows of this table, in order
+        self._index = _index
+
+    @classmethod
+    def from_db(cls, db_class=None, keys=None):
+        """Builds a table of all of the tracks in a database (the default database if db_class
+           isn't given)."""
+        if db_class is None:
+            db_class = config.DefaultDb()
+        return cls(db_class.load_all(), keys)
+
+    @property
+    def keys(self):
+        return tuple(self._columns.keys())
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def _codes(self, key):
+        return map(self._columns[key].data.__getitem__, self._index)
+
+    def _derive(self, index):
+        return self.__class__(self._objects, _columns=self._columns, _index=index)
+
+    def column(self, key):
+        """Returns the values of key for each row."""
+        return self._columns[key].decode(self._codes(key))
+
+    def rows(self):
+        """Returns the objects the table was built from, for each row."""
+        return list(map(self._objects.__getitem__, self._index))
+
+    def tracks(self, open_files=False):
+        """Returns each row as a Track. If open_files is True, the music file of each track is
+           opened as well; otherwise the tracks are backed only by the database objects (or
+           other metadata) the table was built from."""
+        from core.track import Track
+        from db.db import MusicDb
+        if open_files:
+            return Track.from_files([obj.location for obj in self.rows()])
+        tracks = list()
+        for obj in self.rows():
+            if isinstance(obj, MusicDb):
+                tracks.append(Track(db=obj))
+            else:
+                tracks.append(Track(other=obj))
+        return tracks
+
+    def filter(self, **conditions):
+        """Returns a table of the rows matching all of conditions, given as key=condition. A
+           condition is a set, list or tuple of values to keep; a function returning True
+           for the values to keep (it is called once per distinct value, and never for None);
+           or a single value to keep."""
+        index = self._index
+        for key, cond in conditions.items():
+            column = self._columns[key]
+            if callable(cond):
+                keep = set([c for c, v in column.distinct().items()
+                            if v is not None and cond(v)])
+            elif isinstance(cond, (set, frozenset, list, tuple)):
+                keep = set(map(column.code, cond))
+            else:
+                keep = {column.code(cond)}
+            codes = map(column.data.__getitem__, index)
+            index = array.array('l', itertools.compress(index, map(keep.__contains__, codes)))
+        return self._derive(index)
+
+    def sort(self, *keys):
+        """Returns a table of the rows sorted the same way as sorted(rows, key=sort_key(*keys)),
+           by default by album artist, album, disc and track number."""
+        if len(keys) == 0:
+            keys = ['album_artist', 'album', 'dn', 'tn']
+        sort_columns = list()
+        for key in keys:
+            column = self._columns[key]
+            default = sort_key_defaults.get(key, 0 if isinstance(column, _IntColumn) else '')
+            ranks = column.sort_ranks(default)
+            codes = list(self._codes(key))
+            sort_columns.append(list(map(ranks.get, codes, codes)))
+        sort_rows = list(zip(*sort_columns))
+        order = sorted(range(len(self._index)), key=sort_rows.__getitem__)
+        return self._derive(array.array('l', map(self._index.__getitem__, order)))
+
+    def group_counts(self, *keys):
+        """Returns a mapping from each combination of the values of keys to the number of rows
+           having it, by default grouping by album and disc number."""
+        if len(keys) == 0:
+            keys = ('album', 'dn')
+        counts = collections.Counter(zip(*[self._codes(key) for key in keys]))
+        columns = [self._columns[key] for key in keys]
+        groups = zip(*[column.decode(codes) for column, codes in
+                       zip(columns, zip(*counts.keys()))])
+        return dict(zip(groups, counts.values()))
+
+def main():
+    import sys
+    import time
+
+    start = time.perf_counter()
+    table = LibraryTable.from_db()
+    print('Loaded %d tracks in %.2fs' % (len(table), time.perf_counter() - start))
+
+    start = time.perf_counter()
+    table = table.sort()
+    print('Sorted in %.3fs' % (time.perf_counter() - start))
+
+    if len(sys.argv) > 1:
+        table = table.filter(album_artist=sys.argv[1])
+    for (album, dn), count in sorted(table.group_counts().items(),
+                                     key=lambda item: (item[0][0] or '', item[0][1] or 0)):
+        print('%s, disc %s: %d tracks' % (album, dn, count))
+
+if __name__ == '__main__':
+    main()
@@ -86,7 +86,7 @@ def _create_track_mapping(metadatas):
 
 def match_metadata_to_files(fnames, metadatas, use_db=False):
     default_metadata = 'db' if use_db else 'mfile'
-    tracks = [Track.from_file(fname, default_metadata=default_metadata) for fname in fnames]
+    tracks = Track.from_files(fnames, default_metadata=default_metadata)
     return match_metadata_to_tracks(tracks, metadatas)
 
 def match_metadata_to_tracks(m1, m2, order_by_source=False):
@@ -5,16 +5,29 @@ from .ogg import OggFile
 from .flac import FlacFile
 from .m4a import M4AFile
 from .wav import WaveFile
+from .opus import OpusFile
+from .cache import tag_cache
+from .scan import scan_music_files, warm_tag_cache
+from core.trace import traced
 
-mapping = dict([(f.ext, f) for f in (MP3File, OggFile, FlacFile, M4AFile, WaveFile)])
+mapping = dict([(f.ext, f) for f in (MP3File, OggFile, FlacFile, M4AFile, WaveFile,
+                                           OpusFile)])
 
-def open_music_file(fname):
+@traced('open_music_file')
+def open_music_file(fname, stat_only=False):
+    """Opens a music file with the MusicFile class for its extension. If stat_only is True, only
+       its file system properties (location, fsize) can be accessed, and the file isn't parsed."""
     if not os.path.exists(fname):
         return None
 
     _, ext = os.path.splitext(fname)
     ext = ext.lower()
     if ext in mapping:
+        if stat_only:
+            return mapping[ext](fname, stat_only=True)
+        cache = tag_cache()
+        if cache is not None:
+            return cache.open(fname, mapping[ext])
         return mapping[ext](fname)
     
     raise KeyError(ext)
@@ -0,0 +1,281 @@
+"""Persistent cache of the metadata read from music files, keyed by (path, size, mtime)."""
+
+import atexit
+import hashlib
+import json
+import os
+import os.path
+import threading
+
+import config
+from core import db_glue
+from mfile.mfile import MusicFile
+
+# Number of new cache entries to write before committing them
+commit_interval = 100
+
+# Keys that are never stored in the cache; they are derived or come from the file system
+uncached_keys = MusicFile.derived_keys | {'location', 'fsize'}
+
+# Types of the values that come back from the cache as they went in
+json_types = (str, int, float, bool, type(None))
+
+def cacheable(value):
+    """Whether a value survives a round trip through JSON unchanged."""
+    if isinstance(value, list):
+        return all([cacheable(v) for v in value])
+    return isinstance(value, json_types)
+
+class CachedMusicFile(MusicFile):
+    """Read-only view of a music file's metadata as stored in the tag cache. The file itself
+       is only opened (with its real MusicFile class) once a change is requested."""
+
+    def __init__(self, fname, file_class, d, fsize):
+        self.file_class = file_class
+        self.mfile = None
+        d = dict(d)
+        # Metadata.album_artist reads the underlying field directly
+        d['albumartist'] = d.pop('album_artist', None)
+        d['fsize'] = fsize
+        super(CachedMusicFile, self).__init__(fname, d)
+
+    def load(self):
+        """Opens the underlying music file, if it hasn't been opened already, and returns it."""
+        if self.mfile is None:
+            self.mfile = self.file_class(self.fname)
+        return self.mfile
+
+    def _refresh_from_mfile(self):
+        d = self.mfile.to_dict()
+        d['albumartist'] = d.pop('album_artist', None)
+        self.wrapped.update(d)
+
+    def __setattr__(self, key, value):
+        if key in self.all_keys:
+            setattr(self.load(), key, value)
+            self._refresh_from_mfile()
+            self._notify()
+        else:
+            super(CachedMusicFile, self).__setattr__(key, value)
+
+    def __delattr__(self, key):
+        if key in self.all_keys:
+            delattr(self.load(), key)
+            self._refresh_from_mfile()
+            self._notify()
+        else:
+            super(CachedMusicFile, self).__delattr__(key)
+
+    # FileBased methods overridden
+
+    @property
+    def staged(self):
+        if self.mfile is None:
+            return dict()
+        return self.mfile.staged
+
+    def _copy_changes(self):
+        pass
+
+    def changes(self):
+        if self.mfile is None:
+            return dict()
+        return self.mfile.changes()
+
+    def save(self):
+        if self.mfile is None:
+            return False
+        saved = self.mfile.save()
+        # Pick up the new file size and bitrate
+        self._refresh_from_mfile()
+        self._notify()
+        if saved:
+            cache = tag_cache()
+            if cache is not None:
+                cache.store(self.mfile)
+        return saved
+
+    # MusicFile methods overridden
+
+    def refresh(self):
+        # The cached values may be out of date, so read the file itself
+        self.load().rebase(self.fname)
+        self._refresh_from_mfile()
+        self._notify()
+
+    def rebase(self, new_fname):
+        self.fname = new_fname
+        if self.mfile is not None:
+            self.mfile.rebase(new_fname)
+
+    def create_decoder(self):
+        return self.load().create_decoder()
+
+    def audio_payload(self, fobj):
+        return self.file_class.audio_payload(fobj)
+
+    @property
+    def ext(self):
+        return self.file_class.ext
+
+    @property
+    def rewritten(self):
+        if self.mfile is None:
+            return None
+        return self.mfile.rewritten
+
+    @property
+    def fsize(self):
+        return self.get_item('fsize')
+
+class TagCache(object):
+    """sqlite-backed store of normalized MusicFile metadata and audio content hashes. Entries
+       are only used if the size and modification time of the file still match those recorded
+       with them."""
+
+    def __init__(self, loc):
+        self.loc = loc
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._pending = 0
+        self._lock = threading.RLock()
+
+    @property
+    def db(self):
+        # Threads look entries up concurrently, each with its own connection; new entries are
+        # written through the pool's writer connection
+        if self._db is not None:
+            return self._db
+        with self._lock:
+            if self._db is not None:
+                return self._db
+            d = os.path.dirname(self.loc)
+            if d and not os.path.isdir(d):
+                os.makedirs(d)
+            db = db_glue.ConnectionPool(self.loc)
+            db.write("""CREATE TABLE IF NOT EXISTS tags
+(location text PRIMARY KEY,
+size integer NOT NULL,
+mtime integer NOT NULL,
+class text NOT NULL,
+data text NOT NULL)""")
+            db.write("""CREATE TABLE IF NOT EXISTS hashes
+(location text PRIMARY KEY,
+size integer NOT NULL,
+mtime integer NOT NULL,
+hash text NOT NULL)""")
+            db.commit()
+            self._db = db
+        return self._db
+
+    def open(self, fname, file_class):
+        """Returns the metadata of fname, either as a CachedMusicFile if the cache holds an up to
+           date entry for it or by opening it with file_class (and caching the result once it
+           has been read)."""
+        st = os.stat(fname)
+        rows = self.db.sql('SELECT data FROM tags WHERE location = ? AND size = ? AND '
+                           'mtime = ? AND class = ?', fname, st.st_size, st.st_mtime_ns,
+                           file_class.__name__)
+        if rows:
+            with self._lock:
+                self.hits += 1
+            return CachedMusicFile(fname, file_class, json.loads(rows[0]['data']), st.st_size)
+
+        with self._lock:
+            self.misses += 1
+        # The file is only parsed when its tags are first read; it is cached then, under the
+        # size and modification time it had when it was opened
+        mfile = file_class(fname)
+        mfile.on_load = lambda mfile: self.store(mfile, st)
+        return mfile
+
+    def store(self, mfile, st=None):
+        """Adds or replaces the cache entry for a MusicFile. Files with values that JSON can't
+           represent exactly aren't cached (and any older entry for them is removed), so that
+           cache hits always return the same values as opening the file."""
+        if st is None:
+            st = os.stat(mfile.location)
+        data = dict([(k, v) for k, v in mfile.to_dict().items() if k not in uncached_keys])
+        with self._lock:
+            if not all([cacheable(v) for v in data.values()]):
+                self.db.write('DELETE FROM tags WHERE location = ?', mfile.location)
+            else:
+                self.db.write('INSERT OR REPLACE INTO tags (location, size, mtime, class, data) '
+                              'VALUES (?, ?, ?, ?, ?)', mfile.location, st.st_size,
+                              st.st_mtime_ns, mfile.__class__.__name__, json.dumps(data))
+            self._pending += 1
+            if self._pending >= commit_interval:
+                self.commit()
+
+    def get_hash(self, fname, st):
+        """Returns the cached content hash of fname, or None if there is none up to date."""
+        rows = self.db.sql('SELECT hash FROM hashes WHERE location = ? AND size = ? AND '
+                           'mtime = ?', fname, st.st_size, st.st_mtime_ns)
+        if rows:
+            return rows[0]['hash']
+        return None
+
+    def store_hash(self, fname, st, digest):
+        with self._lock:
+            self.db.write('INSERT OR REPLACE INTO hashes (location, size, mtime, hash) '
+                          'VALUES (?, ?, ?, ?)', fname, st.st_size, st.st_mtime_ns, digest)
+            self._pending += 1
+            if self._pending >= commit_interval:
+                self.commit()
+
+    def commit(self):
+        with self._lock:
+            if self._pending and self._db is not None:
+                self._db.commit()
+            self._pending = 0
+
+    def clear(self):
+        with self._lock:
+            self.db.write('DELETE FROM tags')
+            self.db.write('DELETE FROM hashes')
+            self.db.commit()
+            self._pending = 0
+
+    def __str__(self):
+        total = self.hits + self.misses
+        rate = 100 * self.hits / total if total else 0
+        return 'Tag cache: %d hits, %d misses (%.1f%% hit rate)' % (self.hits, self.misses, rate)
+
+_tag_cache = None
+
+def tag_cache():
+    """Returns the process-wide TagCache, or None if it is disabled in the config."""
+    global _tag_cache
+    if _tag_cache is None and config.TagCacheLoc:
+        _tag_cache = TagCache(config.TagCacheLoc)
+        atexit.register(_tag_cache.commit)
+    return _tag_cache
+
+# Content hashes computed in this process, used when the tag cache is disabled
+_content_hashes = dict()
+
+def content_hash(mfile):
+    """Returns the hex digest of a MusicFile's audio payload (see MusicFile.content_hash)."""
+    fname = mfile.location
+    st = os.stat(fname)
+    key = (fname, st.st_size, st.st_mtime_ns)
+    cache = tag_cache()
+    if cache is not None:
+        digest = cache.get_hash(fname, st)
+    else:
+        digest = _content_hashes.get(key)
+    if digest is not None:
+        return digest
+
+    h = hashlib.sha1()
+    with open(fname, 'rb') as fobj:
+        for chunk in mfile.audio_payload(fobj):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    if cache is not None:
+        cache.store_hash(fname, st, digest)
+    else:
+        _content_hashes[key] = digest
+    return digest
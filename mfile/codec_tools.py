@@ -0,0 +1,128 @@
+"""Probing of the command line codec tools that are available, and ffmpeg-based decoders and
+   encoders for formats without a dedicated tool. All decoders write raw audio in the format
+   given by the config.Raw* options, which is what all encoders read."""
+
+import shutil
+import subprocess
+
+import config
+
+# Tools the MusicFile classes can use, and the arguments that make each print its version
+tool_version_args = {'flac': ['--version'],
+                     'oggenc': ['--version'],
+                     'oggdec': ['--version'],
+                     'lame': ['--version'],
+                     'ffmpeg': ['-version'],
+                     'opusenc': ['--version'],
+                     'opusdec': ['--version']}
+
+class CodecUnavailableError(NotImplementedError):
+    """Raised when creating a decoder or encoder that needs a tool that isn't installed."""
+    pass
+
+# Tool name -> full path (or None if not installed); filled in on first use
+_tool_paths = None
+# Tool name -> version string
+_tool_versions = dict()
+
+def available_tools():
+    """Returns a dict mapping the name of each known tool to its path, or None if it isn't
+       installed. The search is only done once per process."""
+    global _tool_paths
+    if _tool_paths is None:
+        _tool_paths = dict([(tool, shutil.which(tool)) for tool in tool_version_args])
+    return _tool_paths
+
+def have_tool(tool):
+    return available_tools().get(tool, None) is not None
+
+def require_tool(tool, purpose):
+    """Raises CodecUnavailableError if tool isn't installed."""
+    if not have_tool(tool):
+        raise CodecUnavailableError('%s is required for %s but was not found' % (tool, purpose))
+
+def tool_version(tool):
+    """Returns the first line of the version information printed by tool, or None if it
+       isn't installed."""
+    if tool not in _tool_versions:
+        version = None
+        if have_tool(tool):
+            try:
+                sp = subprocess.run([tool] + tool_version_args.get(tool, ['--version']),
+                                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                    universal_newlines=True)
+                version = sp.stdout.strip().split('\n')[0].strip()
+            except OSError:
+                pass
+        _tool_versions[tool] = version
+    return _tool_versions[tool]
+
+# ffmpeg
+
+def ffmpeg_raw_format():
+    """Returns the ffmpeg sample format name (e.g. s16be) matching the config.Raw* options."""
+    fmt = '%s%d' % ('s' if config.RawSigned == 'signed' else 'u', config.RawBitsPerSample)
+    if config.RawBitsPerSample > 8:
+        fmt += 'be' if config.RawEndianness == 'big' else 'le'
+    return fmt
+
+def ffmpeg_raw_args():
+    return ['-f', ffmpeg_raw_format(),
+            '-ar', '%d' % config.RawSampleRate,
+            '-ac', '%d' % config.RawChannels]
+
+# Metadata keys -> ffmpeg metadata names
+ffmpeg_tag_names = [('title', 'title'),
+                    ('artist', 'artist'),
+                    ('album', 'album'),
+                    ('album_artist', 'album_artist'),
+                    ('genre', 'genre'),
+                    ('year', 'date'),
+                    ('grouping', 'grouping')]
+
+def ffmpeg_metadata_args(metadata):
+    """Returns ffmpeg -metadata arguments for the tags in metadata (a dict)."""
+    args = list()
+    for key, name in ffmpeg_tag_names:
+        value = metadata.get(key, None)
+        if value is not None:
+            args.extend(['-metadata', '%s=%s' % (name, value)])
+    for num_key, count_key, name in (('tn', 'tc', 'track'), ('dn', 'dc', 'disc')):
+        num, count = metadata.get(num_key, None), metadata.get(count_key, None)
+        if num:
+            if count:
+                args.extend(['-metadata', '%s=%d/%d' % (name, num, count)])
+            else:
+                args.extend(['-metadata', '%s=%d' % (name, num)])
+    return args
+
+def ffmpeg_decoder(fname):
+    """Returns an ffmpeg subprocess decoding fname to raw audio on its stdout, resampled to
+       the configured rate and channel count if necessary."""
+    require_tool('ffmpeg', 'decoding %s' % fname)
+    return subprocess.Popen(['ffmpeg', '-nostdin', '-v', 'error', '-i', fname, '-vn'] +
+                            ffmpeg_raw_args() + ['-'],
+                            stdout=subprocess.PIPE)
+
+def ffmpeg_encoder(fname, codec_args, metadata, infile=None):
+    """Returns an ffmpeg subprocess encoding raw audio from its stdin (or infile, in any format
+       ffmpeg can read) to fname with the given codec arguments and tags."""
+    require_tool('ffmpeg', 'encoding %s' % fname)
+    if infile is None:
+        input_args = ffmpeg_raw_args() + ['-i', '-']
+    else:
+        input_args = ['-nostdin', '-i', infile]
+    return subprocess.Popen(['ffmpeg', '-v', 'error', '-y'] + input_args +
+                            ['-vn', '-map_metadata', '-1'] + codec_args +
+                            ffmpeg_metadata_args(metadata) + [fname],
+                            stdin=subprocess.PIPE if infile is None else None)
+
+def main():
+    for tool, path in sorted(available_tools().items()):
+        if path is None:
+            print('%s: not found' % tool)
+        else:
+            print('%s: %s (%s)' % (tool, path, tool_version(tool)))
+
+if __name__ == '__main__':
+    main()
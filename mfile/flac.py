@@ -1,14 +1,19 @@
+import os
 import subprocess
 
 from mutagen.flac import FLAC
 
 import config
 from mfile.mutagen_wrapper import MutagenFile
+from mfile.mfile import read_range
+from mfile.mp3 import skip_id3v2
+from mfile.codec_tools import have_tool, require_tool, ffmpeg_decoder
 from core.util import int_descriptor
 
 class FlacFile(MutagenFile):
 
     ext = '.flac'
+    encoder_tool = 'flac'
 
     mapping = {'album_artist': 'albumartist',
                'album_artist_sort': 'albumartistsort',
@@ -24,6 +29,9 @@ class FlacFile(MutagenFile):
         return FLAC(fname)
 
     def create_decoder(self):
+        if not have_tool('flac') and have_tool('ffmpeg'):
+            return ffmpeg_decoder(self.fname)
+        require_tool('flac', 'decoding %s' % self.fname)
         decoder = subprocess.Popen(["flac", '--force-raw-format',
                                     "--decode",
                                     "--silent",
@@ -37,6 +45,7 @@ class FlacFile(MutagenFile):
     @classmethod
     def create_encoder(self, fname, metadata, bitrate, infile=None):
         # Ignores bitrate parameter
+        require_tool('flac', 'encoding %s' % fname)
         tags = list()
         # See https://www.xiph.org/vorbis/doc/v-comment.html
         metadata_list = [(metadata['title'], 'TITLE'),
@@ -66,6 +75,28 @@ class FlacFile(MutagenFile):
                                     ['-' if infile is None else infile], stdin=subprocess.PIPE)
         return encoder
 
+    def raw_tags(self):
+        tags = super(FlacFile, self).raw_tags()
+        # Embedded art is stored in metadata blocks of its own; '~' can't be in a comment name
+        tags['~pictures'] = [picture.write() for picture in self.wrapped.pictures]
+        return tags
+
+    @classmethod
+    def audio_payload(cls, fobj):
+        start = skip_id3v2(fobj)
+        fobj.seek(start)
+        if fobj.read(4) != b'fLaC':
+            raise ValueError('%s is not a FLAC file' % fobj.name)
+        # Skip the metadata blocks; each header holds a last-block flag and the block length
+        last = False
+        while not last:
+            header = fobj.read(4)
+            if len(header) < 4:
+                break
+            last = header[0] & 0x80
+            fobj.seek(int.from_bytes(header[1:4], 'big'), 1)
+        yield from read_range(fobj, fobj.tell(), os.fstat(fobj.fileno()).st_size)
+
     year = int_descriptor('date')
     tn = int_descriptor('tracknumber')
     tc = int_descriptor('totaltracks')
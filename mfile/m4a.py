@@ -1,3 +1,5 @@
+import os
+import struct
 import subprocess
 from datetime import datetime
 
@@ -5,11 +7,14 @@ from mutagen.mp4 import MP4
 
 import config
 from mfile.mutagen_wrapper import MutagenFile
+from mfile.mfile import read_range
+from mfile.codec_tools import ffmpeg_decoder, ffmpeg_encoder
 from core.util import int_descriptor, make_numcount_descriptors
 
 class M4AFile(MutagenFile):
 
     ext = '.m4a'
+    encoder_tool = 'ffmpeg'
     mapping = {'title': '\xa9nam',
                'title_sort': 'sonm',
                'artist': '\xa9ART',
@@ -54,7 +59,7 @@ class M4AFile(MutagenFile):
 
     @tn.setter
     def tn(self, value):
-        self.set_item('trkn', (value, self.get_item('trkn')[1]))
+        self.set_item('trkn', (value, (self.get_item('trkn') or (0, 0))[1]))
 
     @tn.deleter
     def tn(self):
@@ -70,7 +75,7 @@ class M4AFile(MutagenFile):
 
     @tc.setter
     def tc(self, value):
-        self.set_item('trkn', (self.get_item('trkn')[0], value))
+        self.set_item('trkn', ((self.get_item('trkn') or (0, 0))[0], value))
 
     @tc.deleter
     def tc(self):
@@ -87,7 +92,7 @@ class M4AFile(MutagenFile):
 
     @dn.setter
     def dn(self, value):
-        self.set_item('disk', (value, self.get_item('disk')[1]))
+        self.set_item('disk', (value, (self.get_item('disk') or (0, 0))[1]))
 
     @dn.deleter
     def dn(self):
@@ -103,18 +108,39 @@ class M4AFile(MutagenFile):
 
     @dc.setter
     def dc(self, value):
-        self.set_item('disk', (self.get_item('disk')[0], value))
+        self.set_item('disk', ((self.get_item('disk') or (0, 0))[0], value))
 
     @dc.deleter
     def dc(self):
         self.set_item('disk', (self.get_item('disk')[0], None))
 
     def create_decoder(self):
-        raise NotImplementedError
+        return ffmpeg_decoder(self.fname)
 
     @classmethod
-    def create_encoder(self, fname, metadata, bitrate):
-        raise NotImplementedError
+    def create_encoder(self, fname, metadata, bitrate, infile=None):
+        return ffmpeg_encoder(fname, ['-c:a', 'aac', '-b:a', '%dk' % bitrate], metadata,
+                              infile=infile)
+
+    @classmethod
+    def audio_payload(cls, fobj):
+        # The audio is in the top-level mdat atom(s); tags are in moov
+        file_size = os.fstat(fobj.fileno()).st_size
+        offset = 0
+        while offset + 8 <= file_size:
+            fobj.seek(offset)
+            size, atom_type = struct.unpack('>I4s', fobj.read(8))
+            header_size = 8
+            if size == 1:
+                size = struct.unpack('>Q', fobj.read(8))[0]
+                header_size = 16
+            elif size == 0:
+                size = file_size - offset
+            if size < header_size:
+                raise ValueError('%s has an invalid atom at %d' % (fobj.name, offset))
+            if atom_type == b'mdat':
+                yield from read_range(fobj, offset + header_size, offset + size)
+            offset += size
 
 def main():
     import sys
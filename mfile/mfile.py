@@ -5,10 +5,26 @@ import os
 
 from core.file_based import FileBased
 
+# Size of the chunks read when hashing audio payloads
+read_chunk_size = 2 ** 20
+
+def read_range(fobj, start, end, chunk_size=read_chunk_size):
+    """Yields the bytes of fobj from start up to end, a chunk at a time."""
+    fobj.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = fobj.read(min(chunk_size, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
 class MusicFile(FileBased):
 
     sigil = '%'
     ext = ''
+    # Command line tool used by create_encoder, if any
+    encoder_tool = None
 
     """Base class for metadata derived from a music file."""
 
@@ -34,6 +50,7 @@ class MusicFile(FileBased):
         """Refreshes this MusicFile from the file, e.g. if it has been modified
            by an external program."""
         self.rebase(self.fname)
+        self._notify()
 
     def move(self, new_fname):
         """Moves this MusicFile to a new location."""
@@ -42,6 +59,14 @@ class MusicFile(FileBased):
             os.makedirs(d)
         shutil.move(self.fname, new_fname)
         self.rebase(new_fname)
+        self._notify()
+
+    def content_hash(self):
+        """Returns a hex digest of the file's audio payload, which, unlike its size or
+           modification time, doesn't change when its tags are edited. Results are cached
+           by (path, size, mtime)."""
+        from mfile.cache import content_hash
+        return content_hash(self)
 
     # Descriptor
 
@@ -70,3 +95,8 @@ class MusicFile(FileBased):
     def create_encoder(self, fname, metadata, bitrate):
         """Returns a subprocess for encoding data from stdin to the specified filename."""
         raise NotImplementedError
+
+    @classmethod
+    def audio_payload(cls, fobj):
+        """Yields the bytes of the audio data in a file of this type, excluding any tags."""
+        raise NotImplementedError
@@ -1,8 +1,12 @@
+import os
 import subprocess
 
 from mutagen.mp3 import MP3
+from mutagen.apev2 import APEv2, APENoHeaderError
 import mutagen.id3 as id3
 from mfile.mutagen_wrapper import MutagenFile
+from mfile.mfile import read_range
+from mfile.codec_tools import require_tool, ffmpeg_decoder
 
 import config
 from core.util import make_numcount_descriptors, int_descriptor
@@ -12,9 +16,41 @@ from core.util import make_numcount_descriptors, int_descriptor
 
 encoding = id3.Encoding.UTF8
 
+def skip_id3v2(fobj):
+    """Returns the offset of the first byte after any ID3v2 tags at the start of a file."""
+    start = 0
+    fobj.seek(0)
+    header = fobj.read(10)
+    while len(header) == 10 and header[:3] == b'ID3':
+        # Tag size is a 28-bit "syncsafe" integer, excluding the header and optional footer
+        size = 0
+        for b in header[6:10]:
+            size = (size << 7) | (b & 0x7f)
+        start += 10 + size + (10 if header[5] & 0x10 else 0)
+        fobj.seek(start)
+        header = fobj.read(10)
+    return start
+
+def trailing_tags_start(fobj, end):
+    """Returns the offset of the start of any ID3v1 and APEv2 tags at the end of a file."""
+    if end >= 128:
+        fobj.seek(end - 128)
+        if fobj.read(3) == b'TAG':
+            end -= 128
+    if end >= 32:
+        fobj.seek(end - 32)
+        footer = fobj.read(32)
+        if footer[:8] == b'APETAGEX':
+            # Tag size includes the footer, but not the header (if present)
+            size = int.from_bytes(footer[12:16], 'little')
+            flags = int.from_bytes(footer[20:24], 'little')
+            end -= size + (32 if flags & 0x80000000 else 0)
+    return end
+
 class MP3File(MutagenFile):
 
     ext = '.mp3'
+    encoder_tool = 'lame'
 
     def mutagen_class(self, fname):
         return MP3(fname)
@@ -35,50 +71,65 @@ class MP3File(MutagenFile):
             self.wrapped[key] = frame
 
     def create_decoder(self):
-        # decoder = subprocess.Popen(['lame', '--decode', '-t', '--mp3input',
-        #                             '--silent',
-        #                             self.fname, '-'],
-        #                 stdout=subprocess.PIPE)
-        # return decoder
-        raise NotImplementedError
+        # lame can't write raw audio in every format allowed by the config, so use ffmpeg
+        return ffmpeg_decoder(self.fname)
 
     @classmethod
     def create_encoder(self, fname, metadata, bitrate, infile=None):
+        require_tool('lame', 'encoding %s' % fname)
         tags = list()
-        if metadata.title:
-            tags.extend(['--tt', metadata.title])
-        if metadata.artist:
-            tags.extend(['--ta', metadata.artist])
-        if metadata.album:
-            tags.extend(['--tl', metadata.album])
-        if metadata.year:
-            tags.extend(['--ty', str(metadata.year)])
-        if metadata.tn:
-            if metadata.tc:
-                tags.extend(['--tn', '%d/%d' % metadata.tnc])
+        if metadata.get('title', None):
+            tags.extend(['--tt', metadata['title']])
+        if metadata.get('artist', None):
+            tags.extend(['--ta', metadata['artist']])
+        if metadata.get('album', None):
+            tags.extend(['--tl', metadata['album']])
+        if metadata.get('year', None):
+            tags.extend(['--ty', str(metadata['year'])])
+        if metadata.get('tn', None):
+            if metadata.get('tc', None):
+                tags.extend(['--tn', '%d/%d' % (metadata['tn'], metadata['tc'])])
             else:
-                tags.extend(['--tn', str(metadata.tn)])
-        if metadata.dn:
-            if metadata.dc:
-                tags.extend(['--tv', 'TPOS=%d/%d' % metadata.dnc])
+                tags.extend(['--tn', str(metadata['tn'])])
+        if metadata.get('dn', None):
+            if metadata.get('dc', None):
+                tags.extend(['--tv', 'TPOS=%d/%d' % (metadata['dn'], metadata['dc'])])
             else:
-                tags.extend(['--tv', 'TPOS=%d' % metadata.dn])
-        if metadata.genre:
-            tags.extend(['--tg', metadata.genre])
-
-        encoder = subprocess.Popen(["lame", '-r',
-                                    '-s', '%s' % (config.RawSampleRate / 1000),
-                                    '--bitwidth', str(config.RawBitsPerSample),
-                                    '--%s' % config.RawSigned,
-                                    '--%s-endian' % config.RawEndianness,
-                                    '--silent',
-                                    '--noreplaygain',
-                                    '-q', '%d' % config.MP3Qual,
-                                    '-b', '%d' % bitrate] + tags +
-                                      ['-' if infile is None else infile, fname], stdin=subprocess.PIPE,
-                                    stderr=subprocess.DEVNULL)
+                tags.extend(['--tv', 'TPOS=%d' % metadata['dn']])
+        if metadata.get('genre', None):
+            tags.extend(['--tg', metadata['genre']])
+
+        args = ["lame"]
+        if infile is None:
+            args.extend(['-r',
+                         '-s', '%s' % (config.RawSampleRate / 1000),
+                         '--bitwidth', str(config.RawBitsPerSample),
+                         '--%s' % config.RawSigned,
+                         '--%s-endian' % config.RawEndianness])
+        args.extend(['--silent',
+                     '--noreplaygain',
+                     '-q', '%d' % config.MP3Qual,
+                     '-b', '%d' % bitrate])
+        encoder = subprocess.Popen(args + tags + ['-' if infile is None else infile, fname],
+                                   stdin=subprocess.PIPE if infile is None else None,
+                                   stderr=subprocess.DEVNULL)
         return encoder
 
+    def raw_tags(self):
+        tags = super(MP3File, self).raw_tags()
+        # APEv2 tags are separate from the ID3 tags, at the end of the file
+        try:
+            tags['~apev2'] = dict(APEv2(self.fname).items())
+        except APENoHeaderError:
+            pass
+        return tags
+
+    @classmethod
+    def audio_payload(cls, fobj):
+        start = skip_id3v2(fobj)
+        end = trailing_tags_start(fobj, os.fstat(fobj.fileno()).st_size)
+        yield from read_range(fobj, start, end)
+
     @property
     def album_artist(self):
         choices = [self.get_item('TXXX:QuodLibet::albumartist'),
@@ -102,6 +153,9 @@ class MP3File(MutagenFile):
         self.del_item('TXXX:QuodLibet::albumartist')
         self.del_item('TSO2')
 
+    # album_artist can be stored in TSO2
+    linked_keys = MutagenFile.linked_keys + [('album_artist', 'album_artist_sort')]
+
     tn, tc, tnc = make_numcount_descriptors('tn', 'tc', 'TRCK')
     dn, dc, dnc = make_numcount_descriptors('dn', 'dc', 'TPOS')
 
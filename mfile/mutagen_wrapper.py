@@ -3,10 +3,13 @@
 import os.path
 
 import config
-from core.mw import MappingWrapper
+from core.mw import MappingWrapper, NotAllowedError
 from mfile.mfile import MusicFile
 
 class MutagenFile(MusicFile):
+    """MusicFile backed by a mutagen object. The file is only parsed when its tags or stream
+       info are first accessed; if opened with stat_only=True, only the file system
+       properties (location, fsize) are available."""
 
     mapping = {'album_artist': 'albumartist',
                'album_artist_sort': 'albumartistsort',
@@ -14,16 +17,50 @@ class MutagenFile(MusicFile):
                'artist_sort': 'artistsort',
                'title_sort': 'titlesort'}
     all_keys = MusicFile.all_keys
+    # Called with the file once it has been parsed, if set (see TagCache.open)
+    on_load = None
 
-    def __init__(self, fname):
+    def __init__(self, fname, stat_only=False):
         if os.path.splitext(fname)[1].lower() != self.ext:
             raise ValueError('Cannot open the file %s with %s' % (fname,
                                     self.__class__.__name__))
-        audio = self.mutagen_class(fname)
-        MusicFile.__init__(self, fname, audio)
+        self.stat_only = stat_only
+        # Whether the last save rewrote the whole file (None if it hasn't been saved)
+        self.rewritten = None
+        MusicFile.__init__(self, fname, None)
+
+    @property
+    def wrapped(self):
+        if self._audio is None:
+            if self.stat_only:
+                raise NotAllowedError('%s was opened stat-only' % self.fname)
+            self._audio = self.mutagen_class(self.fname)
+            if self.on_load is not None:
+                on_load, self.on_load = self.on_load, None
+                on_load(self)
+        return self._audio
+
+    @property
+    def loaded(self):
+        """Whether the file has been parsed yet."""
+        return self._audio is not None
+
+    def raw_tags(self):
+        """Returns all of the tags stored in the file as a dict from mutagen's keys to their
+           values, including those that aren't mapped to any metadata key (e.g. embedded art,
+           ReplayGain or lyrics)."""
+        tags = self.wrapped.tags
+        if tags is None:
+            return dict()
+        return dict([(k, tags[k]) for k in tags.keys()])
 
     # MappingWrapper methods overridden
 
+    def set_dict(self, d):
+        # MappingWrapper passes an empty dict on construction; the mutagen object is
+        # created on first use instead (see wrapped)
+        self._audio = None if isinstance(d, dict) else d
+
     def get_item(self, key):
         value = super(MutagenFile, self).get_item(key)
         if isinstance(value, list) and value:
@@ -36,12 +73,21 @@ class MutagenFile(MusicFile):
     # MusicFile methods overridden
 
     def _save(self, changes):
-        self.wrapped.save()
+        if self._audio is not None:
+            self._audio.save(padding=self._padding)
+
+    def _padding(self, info):
+        """Padding policy for mutagen: keeps the existing padding if the new tags fit in it, so
+           the file is written in place; otherwise reserves config.TagPaddingKB for next time."""
+        self.rewritten = info.padding < 0
+        if self.rewritten:
+            return config.TagPaddingKB * 1024
+        return info.padding
 
     def rebase(self, new_fname):
         self.fname = new_fname
-        self.wrapped = self.mutagen_class(new_fname)
-        self.set_dict(self.wrapped)
+        self._audio = None
+        self._copy_changes()
 
     # Properties/descriptors
 
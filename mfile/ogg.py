@@ -5,16 +5,43 @@ from mutagen.oggvorbis import OggVorbis
 
 import config
 from mfile.mutagen_wrapper import MutagenFile
+from mfile.codec_tools import have_tool, require_tool, ffmpeg_decoder
 from core.util import int_descriptor, make_numcount_descriptors
 
+def ogg_audio_payload(fobj, header_packets=3):
+    """Yields the page data of the audio pages of an Ogg stream. The first header_packets
+       packets are headers (including the comment header holding the tags), and audio always
+       starts on a fresh page after them. Page headers are skipped, as their sequence numbers
+       and checksums change when the comment header grows or shrinks."""
+    fobj.seek(0)
+    packets = 0
+    while True:
+        header = fobj.read(27)
+        if len(header) < 27:
+            break
+        if header[:4] != b'OggS':
+            raise ValueError('%s has an invalid Ogg page' % fobj.name)
+        lacing = fobj.read(header[26])
+        size = sum(lacing)
+        if packets >= header_packets:
+            yield fobj.read(size)
+        else:
+            # A lacing value under 255 ends a packet
+            packets += sum([1 for l in lacing if l < 255])
+            fobj.seek(size, 1)
+
 class OggFile(MutagenFile):
 
     ext = '.ogg'
+    encoder_tool = 'oggenc'
 
     def mutagen_class(self, fname):
         return OggVorbis(fname)
 
     def create_decoder(self):
+        if not have_tool('oggdec') and have_tool('ffmpeg'):
+            return ffmpeg_decoder(self.fname)
+        require_tool('oggdec', 'decoding %s' % self.fname)
         decoder = subprocess.Popen(["oggdec", "--quiet", "-o", '-', '-R',
                                     '-b', '%d' % config.RawBitsPerSample,
                                     '--endian=%d' % (1 if config.RawEndianness == 'big' else 0),
@@ -25,6 +52,7 @@ class OggFile(MutagenFile):
 
     @classmethod
     def create_encoder(self, fname, metadata, bitrate, infile=None):
+        require_tool('oggenc', 'encoding %s' % fname)
         tags = list()
         for value, arg in [(metadata['title'], '-t'),
                            (metadata['album'], '-l'),
@@ -46,8 +74,6 @@ class OggFile(MutagenFile):
                           ]:
             if metadata.get(value, None) is not None:
                 tags.extend(['-c', "%s=%s" % (arg, metadata[value])])
-        func, kwargs, infile = (subprocess.Popen, {"stdin": subprocess.PIPE}, "") \
-            if infile is None else subprocess.run, {}, infile
         args = ["oggenc", '-Q', '-b', '%d' % bitrate, '-o', fname]
         if infile is None:
             args.extend(['-r',
@@ -55,10 +81,15 @@ class OggFile(MutagenFile):
                          '--raw-chan=%d' % config.RawChannels,
                          '--raw-rate=%d' % config.RawSampleRate,
                          '--raw-endianness', '%d' % (1 if config.RawEndianness == 'big' else 0)])
-        args.extend(tags + [infile])
-        encoder = func(args, **kwargs)
+        args.extend(tags + ['-' if infile is None else infile])
+        encoder = subprocess.Popen(args, stdin=subprocess.PIPE if infile is None else None)
         return encoder
 
+    @classmethod
+    def audio_payload(cls, fobj):
+        # Identification, comment and setup headers
+        return ogg_audio_payload(fobj, 3)
+
     year = int_descriptor('date')
     tn = int_descriptor('tracknumber')
     tc = int_descriptor('tracktotal')
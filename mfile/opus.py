@@ -0,0 +1,82 @@
+import subprocess
+
+from mutagen.oggopus import OggOpus
+
+import config
+from mfile.mutagen_wrapper import MutagenFile
+from mfile.ogg import ogg_audio_payload
+from mfile.codec_tools import have_tool, require_tool, ffmpeg_decoder, ffmpeg_raw_format
+from core.util import int_descriptor, make_numcount_descriptors
+
+class OpusFile(MutagenFile):
+
+    ext = '.opus'
+    encoder_tool = 'opusenc'
+
+    def mutagen_class(self, fname):
+        return OggOpus(fname)
+
+    def create_decoder(self):
+        # opusdec can only write 16-bit signed little-endian samples, so prefer ffmpeg
+        if have_tool('ffmpeg') or ffmpeg_raw_format() != 's16le':
+            return ffmpeg_decoder(self.fname)
+        require_tool('opusdec', 'decoding %s' % self.fname)
+        args = ['opusdec', '--quiet', '--rate', '%d' % config.RawSampleRate]
+        if config.RawChannels == 2:
+            args.append('--force-stereo')
+        decoder = subprocess.Popen(args + [self.fname, '-'], stdout=subprocess.PIPE)
+        return decoder
+
+    @classmethod
+    def create_encoder(self, fname, metadata, bitrate, infile=None):
+        require_tool('opusenc', 'encoding %s' % fname)
+        tags = list()
+        for value, arg in [(metadata.get('title', None), '--title'),
+                           (metadata.get('album', None), '--album'),
+                           (metadata.get('artist', None), '--artist'),
+                           (metadata.get('genre', None), '--genre'),
+                           (metadata.get('year', None), '--date')]:
+            if value is not None:
+                tags.extend([arg, str(value)])
+        # Written as "num/count", the way the numcount descriptors read them
+        for num_key, count_key, name in (('tn', 'tc', 'tracknumber'), ('dn', 'dc', 'discnumber')):
+            num, count = metadata.get(num_key, None), metadata.get(count_key, None)
+            if num:
+                if count:
+                    tags.extend(['--comment', '%s=%d/%d' % (name, num, count)])
+                else:
+                    tags.extend(['--comment', '%s=%d' % (name, num)])
+        if metadata.get('album_artist', None) is not None:
+            tags.extend(['--comment', 'albumartist=%s' % metadata['album_artist']])
+
+        args = ['opusenc', '--quiet', '--bitrate', '%d' % bitrate]
+        if infile is None:
+            args.extend(['--raw',
+                         '--raw-bits', '%d' % config.RawBitsPerSample,
+                         '--raw-rate', '%d' % config.RawSampleRate,
+                         '--raw-chan', '%d' % config.RawChannels,
+                         '--raw-endianness', '%d' % (1 if config.RawEndianness == 'big' else 0)])
+        args.extend(tags + ['-' if infile is None else infile, fname])
+        encoder = subprocess.Popen(args, stdin=subprocess.PIPE if infile is None else None)
+        return encoder
+
+    @classmethod
+    def audio_payload(cls, fobj):
+        # Identification and comment headers
+        return ogg_audio_payload(fobj, 2)
+
+    year = int_descriptor('date')
+    tn, tc, tnc = make_numcount_descriptors('tn', 'tc', 'tracknumber')
+    dn, dc, dnc = make_numcount_descriptors('dn', 'dc', 'discnumber')
+
+def main():
+    import sys
+    opus = OpusFile(sys.argv[1])
+
+    print(opus.wrapped)
+    print(opus.format())
+    print(repr(opus))
+    print(opus.calculate_fname())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Bulk reading of music file metadata with a pool of worker threads."""
+
+import collections
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from core.metadata import Metadata
+from mfile.cache import tag_cache
+
+# Number of files read concurrently by default; reading tags is dominated by disk latency
+default_workers = 8
+# Number of files queued for each worker thread at a time
+queued_per_worker = 4
+
+# Keys stored in ScanRecord.tags
+tag_keys = tuple([k for k in Metadata.all_keys if k not in Metadata.derived_keys and
+                  k != 'length'])
+
+class ScanRecord(collections.namedtuple('ScanRecord', ('path', 'tags', 'length', 'bitrate',
+                                                       'size', 'mtime', 'error'))):
+    """Compact, picklable summary of a music file's metadata as read by scan_music_files.
+       tags maps the keys in tag_keys to their (non-None) values. If the file could not be read,
+       error holds the exception raised and all other fields but path are None. mtime is in
+       nanoseconds, as in the tag cache."""
+
+    __slots__ = ()
+
+    def to_metadata(self):
+        """Returns a Metadata object with this record's tags and location."""
+        md = Metadata.from_dict(self.tags)
+        md.location = self.path
+        return md
+
+def scan_music_file(path):
+    """Reads the metadata of a single file and returns it as a ScanRecord."""
+    from mfile import open_music_file
+
+    try:
+        st = os.stat(path)
+        mfile = open_music_file(path)
+        tags = dict()
+        for k in tag_keys:
+            v = getattr(mfile, k)
+            if v is not None:
+                tags[k] = v
+        return ScanRecord(path, tags, mfile.length, mfile.bitrate, st.st_size, st.st_mtime_ns,
+                          None)
+    except Exception as ex:
+        return ScanRecord(path, None, None, None, None, None, ex)
+
+def scan_music_files(paths, workers=default_workers):
+    """Reads the metadata of many files concurrently. Yields a ScanRecord for each path, in the
+       same order as paths; errors are captured in the records rather than raised."""
+    if workers <= 1:
+        yield from map(scan_music_file, paths)
+        return
+
+    # Only a few files per worker are queued at once, so memory use doesn't grow with the
+    # number of paths
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path in paths:
+            pending.append(executor.submit(scan_music_file, path))
+            if len(pending) >= workers * queued_per_worker:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def warm_tag_cache(paths, workers=default_workers):
+    """Reads the given files into the tag cache concurrently, so that opening them afterwards
+       with open_music_file is fast. Does nothing if the tag cache is disabled."""
+    cache = tag_cache()
+    if cache is None:
+        return
+    for _ in scan_music_files(paths, workers):
+        pass
+    cache.commit()
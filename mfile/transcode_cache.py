@@ -0,0 +1,163 @@
+"""Content-addressed cache of transcoded files, so the same source is only encoded once per
+   target format, bitrate, encoder version and set of tags."""
+
+import hashlib
+import json
+import os
+import os.path
+import shutil
+import tempfile
+
+import config
+from core.metadata import Metadata
+from mfile.codec_tools import tool_version
+
+# Fraction of the maximum size evict frees the cache down to, so that a full cache isn't
+# read again on every store
+evict_to = 0.9
+
+# Keys of the metadata passed to an encoder that end up in the encoded file's tags
+tag_keys = tuple([k for k in Metadata.all_keys if k not in Metadata.derived_keys and
+                  k != 'length'])
+
+def encoder_version(file_class):
+    """Returns the version string reported by the command line tool file_class encodes with,
+       or None if it doesn't use one or the tool isn't installed."""
+    if file_class.encoder_tool is None:
+        return None
+    return tool_version(file_class.encoder_tool)
+
+def metadata_tags(metadata):
+    """Returns the taggable values in metadata (a dict or Metadata object) as a plain dict."""
+    if not isinstance(metadata, dict):
+        metadata = metadata.to_dict()
+    return dict([(k, metadata[k]) for k in tag_keys if metadata.get(k, None) is not None])
+
+class TranscodeCache(object):
+    """A directory of transcoded files named by a hash of everything that determines their
+       contents. The total size is kept under max_size bytes by evicting the least recently
+       used files (recorded in their modification times)."""
+
+    def __init__(self, cache_dir, max_size, link=False):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.link = link
+        self.hits = 0
+        self.misses = 0
+        # Running total of the size of the cached files, read from the directory on first use
+        self._size = None
+
+    def key(self, in_mfile, out_class, bitrate, metadata):
+        """Returns the cache key for encoding in_mfile (a MusicFile) to out_class's format."""
+        fields = [in_mfile.content_hash(), out_class.ext, bitrate, encoder_version(out_class),
+                  metadata_tags(metadata)]
+        s = json.dumps(fields, sort_keys=True, default=str)
+        return hashlib.sha1(s.encode('utf8')).hexdigest()
+
+    def path(self, key, ext):
+        return os.path.join(self.cache_dir, key[:2], key + ext)
+
+    def fetch(self, key, outfile):
+        """Puts the cached file for key at outfile, if there is one. Returns True on a hit."""
+        ext = os.path.splitext(outfile)[1]
+        cached = self.path(key, ext)
+        if not os.path.isfile(cached):
+            self.misses += 1
+            return False
+
+        self.hits += 1
+        # Mark as recently used
+        os.utime(cached)
+        if self.link:
+            try:
+                os.link(cached, outfile)
+                return True
+            except OSError:
+                # Probably on a different file system
+                pass
+        shutil.copyfile(cached, outfile)
+        return True
+
+    def store(self, key, outfile):
+        """Adds a newly encoded file to the cache, then evicts old entries if that made it too
+           big."""
+        ext = os.path.splitext(outfile)[1]
+        cached = self.path(key, ext)
+        d = os.path.dirname(cached)
+        if not os.path.isdir(d):
+            os.makedirs(d, exist_ok=True)
+
+        total = self.size()
+        try:
+            total -= os.path.getsize(cached)
+        except FileNotFoundError:
+            pass
+
+        # Copy to a temporary name first so other processes never see a partial file
+        fd, tmp = tempfile.mkstemp(suffix='.part', dir=d)
+        try:
+            with os.fdopen(fd, 'wb') as fobj, open(outfile, 'rb') as src:
+                shutil.copyfileobj(src, fobj)
+                total += fobj.tell()
+            os.replace(tmp, cached)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+        self._size = total
+        if total > self.max_size:
+            self.evict()
+
+    def size(self):
+        """Returns the total size of the cached files. The directory is only read the first
+           time; after that the total is kept up to date by store and evict (files added by
+           other processes are counted the next time evict runs)."""
+        if self._size is None:
+            self._size = sum([size for mtime, size, path in self._entries()])
+        return self._size
+
+    def _entries(self):
+        # (modification time, size, path) of each cached file
+        entries = list()
+        for dirpath, dirnames, filenames in os.walk(self.cache_dir):
+            for fname in filenames:
+                if fname.endswith('.part'):
+                    continue
+                path = os.path.join(dirpath, fname)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self):
+        """Removes the least recently used files until the cache is down to evict_to of
+           max_size."""
+        entries = self._entries()
+        total = sum([size for mtime, size, path in entries])
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size * evict_to:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
+    def __str__(self):
+        return 'Transcode cache: %d hits, %d misses' % (self.hits, self.misses)
+
+_transcode_cache = None
+
+def transcode_cache():
+    """Returns the process-wide TranscodeCache, or None if it is disabled in the config."""
+    global _transcode_cache
+    if _transcode_cache is None and config.TranscodeCacheDir:
+        _transcode_cache = TranscodeCache(config.TranscodeCacheDir,
+                                          config.TranscodeCacheSizeMB * 1000000,
+                                          config.TranscodeCacheLink)
+    return _transcode_cache
@@ -1,11 +1,147 @@
-import subprocess
+import mmap
+import struct
 
 from mutagen.wave import WAVE
 
 import config
 from mfile.mutagen_wrapper import MutagenFile
+from mfile.mfile import read_range
 from core.util import int_descriptor
 
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Translation table that flips the sign bit of a byte, to convert between signed and
+# unsigned samples
+sign_flip_table = bytes([b ^ 0x80 for b in range(256)])
+
+def parse_wave_header(fobj):
+    """Reads the chunks of a RIFF/WAVE file up to its data chunk. Returns a dict describing the
+       sample format of the data and the offsets of its start and end in the file."""
+    riff, _, wave = struct.unpack('<4sI4s', fobj.read(12))
+    if riff != b'RIFF' or wave != b'WAVE':
+        raise ValueError('%s is not a RIFF/WAVE file' % fobj.name)
+
+    fmt = None
+    while True:
+        header = fobj.read(8)
+        if len(header) < 8:
+            raise ValueError('%s has no data chunk' % fobj.name)
+        chunk_id, size = struct.unpack('<4sI', header)
+        if chunk_id == b'fmt ':
+            data = fobj.read(size)
+            format_tag, channels, rate, _, block_align, bits = struct.unpack('<HHIIHH', data[:16])
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and len(data) >= 26:
+                # The real format is the first two bytes of the subformat GUID
+                format_tag = struct.unpack('<H', data[24:26])[0]
+            fmt = {'format_tag': format_tag,
+                   'channels': channels,
+                   'sample_rate': rate,
+                   'block_align': block_align,
+                   'bits_per_sample': bits}
+            fobj.seek(size % 2, 1)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError('%s has no fmt chunk before its data chunk' % fobj.name)
+            fmt['start'] = start = fobj.tell()
+            fmt['end'] = start + size
+            return fmt
+        else:
+            # Chunks are padded to an even number of bytes
+            fobj.seek(size + size % 2, 1)
+
+def make_sample_converter(src_width, src_signed, dest_width, dest_big_endian, dest_signed):
+    """Returns a function that converts a buffer of little-endian samples src_width bytes wide
+       to samples in the destination format, or None if the formats are the same. Samples are
+       narrowed by dropping their least significant bytes, and widened by padding with zeroes."""
+    if (src_width, src_signed) == (dest_width, dest_signed) and \
+        (dest_width == 1 or not dest_big_endian):
+        return None
+
+    # For each byte of a destination sample, the offset of the source byte it comes from
+    src_offsets = list()
+    for i in range(dest_width):
+        significance = dest_width - 1 - i if dest_big_endian else i
+        src_offset = significance + src_width - dest_width
+        src_offsets.append(src_offset if src_offset >= 0 else None)
+    msb = 0 if dest_big_endian else dest_width - 1
+    flip_sign = src_signed != dest_signed
+
+    def convert(chunk):
+        out = bytearray(len(chunk) // src_width * dest_width)
+        for i, src_offset in enumerate(src_offsets):
+            if src_offset is not None:
+                out[i::dest_width] = chunk[src_offset::src_width]
+        if flip_sign:
+            out[msb::dest_width] = out[msb::dest_width].translate(sign_flip_table)
+        return out
+
+    return convert
+
+class WaveDecoder(object):
+    """In-process decoder for PCM WAV files that stands in for a decoder subprocess: the raw
+       audio is read from its stdout, and wait() returns its return code. The data chunk is
+       memory-mapped and read as zero-copy slices when it is already in the raw format given in
+       config; otherwise its samples are converted a chunk at a time."""
+
+    def __init__(self, fname):
+        self.args = [fname]
+        self.returncode = None
+        self.stdout = self
+
+        with open(fname, 'rb') as fobj:
+            fmt = parse_wave_header(fobj)
+            if fmt['format_tag'] != WAVE_FORMAT_PCM:
+                raise ValueError('%s is not in PCM format' % fname)
+            if fmt['channels'] != config.RawChannels or \
+               fmt['sample_rate'] != config.RawSampleRate:
+                raise ValueError('%s has %d channels at %dHz; cannot convert to %d channels at '
+                                 '%dHz' % (fname, fmt['channels'], fmt['sample_rate'],
+                                           config.RawChannels, config.RawSampleRate))
+            self._mmap = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._view = memoryview(self._mmap)
+        self._pos = fmt['start']
+        self._end = min(fmt['end'], len(self._mmap))
+        self._frame_size = fmt['block_align']
+
+        src_width = fmt['block_align'] // fmt['channels']
+        self._convert = make_sample_converter(src_width, src_width > 1,
+                                              config.RawBitsPerSample // 8,
+                                              config.RawEndianness == 'big',
+                                              config.RawSigned == 'signed')
+
+    def read(self, size=-1):
+        """Returns up to size bytes of raw audio, rounded down to whole frames."""
+        remaining = self._end - self._pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        elif size >= self._frame_size:
+            size -= size % self._frame_size
+        chunk = self._view[self._pos:self._pos + size]
+        self._pos += size
+        if self._convert is None:
+            return chunk
+        return self._convert(chunk)
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Slices of the map are still in use; it is closed once they are released
+                pass
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        self.close()
+        self.returncode = 0
+        return self.returncode
+
 class WaveFile(MutagenFile):
 
     ext = '.wav'
@@ -26,12 +162,21 @@ class WaveFile(MutagenFile):
         return WAVE(fname)
 
     def create_decoder(self):
-        return None
+        try:
+            return WaveDecoder(self.fname)
+        except ValueError:
+            # Formats that can't be converted in-process are passed to the encoder as a file
+            return None
 
     @classmethod
     def create_encoder(self, fname, metadata, bitrate):
         raise NotImplementedError
 
+    @classmethod
+    def audio_payload(cls, fobj):
+        fmt = parse_wave_header(fobj)
+        yield from read_range(fobj, fmt['start'], fmt['end'])
+
     # year = int_descriptor('date')
     # tn = int_descriptor('tracknumber')
     # tc = int_descriptor('totaltracks')
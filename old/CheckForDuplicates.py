@@ -2,18 +2,16 @@ import argparse
 from pprint import pprint
 import operator
 
-import db_glue
+from core import db_glue
 
 def check(db, table, fields):
-    rows = db.sql("SELECT * FROM %s" % table)
-
     found = set()
     getter = operator.itemgetter(*fields)
-    for row in rows:
+    for row in db.iter_sql("SELECT * FROM %s" % table):
         key = getter(row)
         if key in found:
             print("DUPLICATE FOUND: %s" % str(key))
-            pprint(row)
+            pprint(dict(row))
         else:
             found.add(key)
 
@@ -10,6 +10,7 @@ from bs4 import BeautifulSoup
 
 from .util import parse_time_str, convert_to_tracks, parse_date_str
 from core.metadata import Metadata
+from core import trace
 import config
 
 # regex for the domain name of a url
@@ -499,12 +500,15 @@ def run_parser(url, d, extra_args, domain=None):
             raise KeyError("No parser defined for domain %r" % domain)
 
     result = None
-    r = requests.get(url, headers=hdr)
+    with trace.span('fetch', domain=domain) as s:
+        r = requests.get(url, headers=hdr)
+        s.add_bytes(len(r.content))
     r.encoding = 'utf8'
 
-    html = r.text
-    soup = BeautifulSoup(html, "lxml")
-    result = d[domain](soup, extra_args)
+    with trace.span('run_parser', domain=domain):
+        html = r.text
+        soup = BeautifulSoup(html, "lxml")
+        result = d[domain](soup, extra_args)
 
     return result
 
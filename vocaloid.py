@@ -14,9 +14,9 @@ DT_FMT = '%Y-%m-%dT%H:%M:%S'
 
 def get_all_vocaloid_songs():
     vocaloid_songs = list()
-    for qldb in QLDb.load_all():
-        if qldb.grouping == 'Vocaloid':
-            vocaloid_songs.append(Track.from_metadata(qldb))
+    for record in QLDb.load_records():
+        if record.grouping == 'Vocaloid':
+            vocaloid_songs.append(Track.from_metadata(record))
     return vocaloid_songs
 
 def create_art_link(track, path):